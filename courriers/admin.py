@@ -1,10 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.conf.urls import patterns, url
 from django.shortcuts import get_object_or_404
-from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext as _, ugettext_lazy
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
+from django.db.models import Sum
 
+from .exceptions import DuplicateSendError
 from .models import Newsletter, NewsletterItem, NewsletterSubscriber, NewsletterList
 
 
@@ -15,8 +17,8 @@ class NewsletterItemInline(admin.TabularInline):
 class NewsletterAdmin(admin.ModelAdmin):
     change_form_template = 'admin/courriers/newsletter/change_form.html'
 
-    list_display = ('name', 'headline', 'published_at', 'status', 'newsletter_list',)
-    list_filter = ('published_at', 'status',)
+    list_display = ('name', 'headline', 'published_at', 'status', 'send_status', 'newsletter_list',)
+    list_filter = ('published_at', 'status', 'send_status',)
     inlines = [NewsletterItemInline]
 
     def get_urls(self):
@@ -36,9 +38,15 @@ class NewsletterAdmin(admin.ModelAdmin):
         backend = backend_klass()
 
         newsletter = get_object_or_404(Newsletter, pk=newsletter_id)
-        backend.send_mails(newsletter)
 
-        self.message_user(request, _('The newsletter "%s" has been sent.') % newsletter)
+        try:
+            backend.send_mails(newsletter)
+        except DuplicateSendError:
+            self.message_user(request, _('The newsletter "%s" is being sent or was already sent.') % newsletter,
+                              level=messages.ERROR)
+        else:
+            self.message_user(request, _('The newsletter "%s" has been sent.') % newsletter)
+
         return HttpResponseRedirect(reverse('admin:courriers_newsletter_change', args=(newsletter.id,)))
 
 
@@ -48,7 +56,16 @@ class NewsletterSubscriberAdmin(admin.ModelAdmin):
 
 
 class NewsletterListAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'created_at',)
+    list_display = ('name', 'slug', 'created_at', 'subscribed_count',)
+
+    def get_queryset(self, request):
+        return (super(NewsletterListAdmin, self).get_queryset(request)
+                .annotate(subscribed_total=Sum('subscriber_counts__subscribed')))
+
+    def subscribed_count(self, obj):
+        return obj.subscribed_total or 0
+    subscribed_count.short_description = ugettext_lazy('Subscribers')
+    subscribed_count.admin_order_field = 'subscribed_total'
 
 
 admin.site.register(Newsletter, NewsletterAdmin)
@@ -1,13 +1,22 @@
 class BaseBackend(object):
 
-    def register(self, email, lang=None, user=None):
+    def register(self, email, lang=None, user=None, using=None):
         raise NotImplemented
 
-    def unregister(self, email, user=None):
+    def unregister(self, email, user=None, using=None):
         raise NotImplemented
 
-    def exists(self, email, user=None):
+    def bulk_register(self, emails, newsletter_list, lang=None, user_ids=None, using=None):
+        raise NotImplementedError
+
+    def bulk_unregister(self, emails, newsletter_list=None, lang=None, using=None):
+        raise NotImplementedError
+
+    def exists(self, email, user=None, using=None):
         raise NotImplemented
 
-    def send_mails(self, newsletter):
-        raise NotImplemented
\ No newline at end of file
+    def subscription_status(self, email, newsletter_list=None, lang=None, user=None, using=None):
+        raise NotImplementedError
+
+    def send_mails(self, newsletter, using=None):
+        raise NotImplemented
@@ -1,7 +1,9 @@
 import logging
 
+from courriers import metrics
 from courriers.settings import FAIL_SILENTLY, DEFAULT_FROM_EMAIL, DEFAULT_FROM_NAME
-from courriers.compat import update_fields
+from courriers.exceptions import DuplicateSendError
+from courriers.models import NewsletterList
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -13,7 +15,11 @@ logger = logging.getLogger('courriers')
 
 
 class CampaignBackend(SimpleBackend):
-    def send_mails(self, newsletter):
+    batched_sends = False
+
+    def send_mails(self, newsletter, using=None):
+        # The recipients are the lists stored by the provider, ``using`` is
+        # accepted for compatibility with SimpleBackend.
         if not newsletter.is_online():
             raise Exception("This newsletter is not online. You can't send it.")
 
@@ -28,29 +34,124 @@ class CampaignBackend(SimpleBackend):
         else:
             ids.append(list_ids[newsletter.newsletter_list.slug])
 
-        for list_id in ids:
-            self.send_campaign(newsletter, list_id)
+        if not newsletter.claim_send():
+            raise DuplicateSendError('The newsletter "%s" is being sent or was already sent.' % newsletter)
+
+        failed = True
+
+        try:
+            failed = not all([self.send_campaign(newsletter, list_id) for list_id in ids])
+        finally:
+            newsletter.finish_send(failed=failed)
 
     def _format_slug(self, *args):
         raise NotImplementedError
 
+    def get_newsletter_lists(self):
+        """
+        Returns the ``(newsletter_list, lang)`` of each provider list id,
+        ``lang`` is ``None`` for the list of every language.
+        """
+        list_ids = self.list_ids
+        lists = {}
+
+        for newsletter_list in NewsletterList.objects.all():
+            keys = [(self._format_slug(newsletter_list.slug), None)]
+
+            for lang in newsletter_list.languages or []:
+                keys.append((self._format_slug(newsletter_list.slug, lang), lang))
+
+            for key, lang in keys:
+                if key in list_ids:
+                    lists[list_ids[key]] = (newsletter_list, lang)
+
+        return lists
+
     @property
     def list_ids(self):
         raise NotImplementedError
 
-    def register(self, email, newsletter_list, lang=None, user=None):
-        super(CampaignBackend, self).register(email, newsletter_list, lang=lang, user=user)
+    def register(self, email, newsletter_list, lang=None, user=None, using=None):
+        super(CampaignBackend, self).register(email, newsletter_list, lang=lang, user=user, using=using)
 
-        list_ids = self.list_ids
+        self._dispatch(self._register_keys(newsletter_list, lang), self._subscribe, email)
+
+    def unregister(self, email, newsletter_list=None, user=None, lang=None, using=None):
+        if newsletter_list:
+            super(CampaignBackend, self).unregister(email, newsletter_list, user=user, lang=lang, using=using)
+
+            self._dispatch(self._unregister_keys(newsletter_list), self._unsubscribe, email)
+        else:
+            for subscriber in self.all(email, user=user, using=self._write_alias(using)):
+                self.unregister(email, subscriber.newsletter_list, user=user, using=using)
+
+    def unregister_subscriber(self, subscriber_id, newsletter_list_id, lang=None, using=None):
+        # The provider list has to be updated, which needs the email
+        using = self._write_alias(using)
+
+        for subscriber in self._manager(using).filter(pk=subscriber_id).select_related('newsletter_list'):
+            self.unregister(subscriber.email, subscriber.newsletter_list, lang=subscriber.lang, using=using)
+
+            return 1
+
+        return 0
+
+    def bulk_register(self, emails, newsletter_list, lang=None, user_ids=None, using=None):
+        count = super(CampaignBackend, self).bulk_register(emails, newsletter_list,
+                                                           lang=lang, user_ids=user_ids, using=using)
+
+        self._dispatch(self._register_keys(newsletter_list, lang), self._subscribe_many, emails)
+
+        return count
+
+    def bulk_unregister(self, emails, newsletter_list=None, lang=None, using=None):
+        if newsletter_list:
+            count = super(CampaignBackend, self).bulk_unregister(emails, newsletter_list, lang=lang, using=using)
+
+            self._dispatch(self._unregister_keys(newsletter_list), self._unsubscribe_many, emails)
+
+            return count
+
+        emails_by_list = {}
+
+        qs = self._manager(self._write_alias(using)).select_related('newsletter_list')
+
+        for subscriber in self._filter_emails(qs, emails):
+            emails_by_list.setdefault(subscriber.newsletter_list, set()).add(subscriber.email)
 
+        return sum(self.bulk_unregister(list(list_emails), newsletter_list, using=using)
+                   for newsletter_list, list_emails in emails_by_list.items())
+
+    def _subscribe_many(self, list_id, emails):
+        for email in emails:
+            self._subscribe(list_id, email)
+
+    def _unsubscribe_many(self, list_id, emails):
+        for email in emails:
+            self._unsubscribe(list_id, email)
+
+    def _register_keys(self, newsletter_list, lang=None):
         keys = [self._format_slug(newsletter_list.slug), ]
 
         if lang:
             keys.append(self._format_slug(newsletter_list.slug, lang))
 
+        return keys
+
+    def _unregister_keys(self, newsletter_list):
+        keys = [self._format_slug(newsletter_list.slug), ]
+
+        if newsletter_list.languages:
+            for lang in newsletter_list.languages:
+                keys.append(self._format_slug(newsletter_list.slug, lang))
+
+        return keys
+
+    def _dispatch(self, keys, method, *args):
+        list_ids = self.list_ids
+
         for key in keys:
             if not key in list_ids:
-
                 message = 'List %s does not exist' % key
 
                 if not FAIL_SILENTLY:
@@ -58,46 +159,20 @@ class CampaignBackend(SimpleBackend):
 
                 logger.error(message)
             else:
+                metrics.incr('courriers_provider_calls_total',
+                             backend=self.__class__.__name__, operation=method.__name__.strip('_'))
+
                 try:
-                    self._subscribe(list_ids[key], email)
+                    method(list_ids[key], *args)
                 except Exception as e:
+                    metrics.incr('courriers_provider_errors_total',
+                                 backend=self.__class__.__name__, operation=method.__name__.strip('_'))
+
                     logger.exception(e)
 
                     if not FAIL_SILENTLY:
                         raise e
 
-    def unregister(self, email, newsletter_list=None, user=None, lang=None):
-        if newsletter_list:
-            super(CampaignBackend, self).unregister(email, newsletter_list, user=user, lang=lang)
-
-            list_ids = self.list_ids
-
-            keys = [self._format_slug(newsletter_list.slug), ]
-
-            if newsletter_list.languages:
-                for lang in newsletter_list.languages:
-                    keys.append(self._format_slug(newsletter_list.slug, lang))
-
-            for key in keys:
-                if not key in list_ids:
-                    message = 'List %s does not exist' % key
-
-                    if not FAIL_SILENTLY:
-                        raise Exception(message)
-
-                    logger.error(message)
-                else:
-                    try:
-                        self._unsubscribe(list_ids[key], email)
-                    except Exception as e:
-                        logger.exception(e)
-
-                        if not FAIL_SILENTLY:
-                            raise e
-        else:
-            for subscriber in self.all(email, user=user):
-                self.unregister(email, subscriber.newsletter_list, user=user)
-
     def send_campaign(self, newsletter, list_id):
         if not DEFAULT_FROM_EMAIL:
             raise ImproperlyConfigured("You have to specify a DEFAULT_FROM_EMAIL in Django settings.")
@@ -113,15 +188,28 @@ class CampaignBackend(SimpleBackend):
 
         translation.activate(language)
 
+        sent = False
+
+        backend = self.__class__.__name__
+
+        metrics.incr('courriers_provider_calls_total', backend=backend, operation='send_campaign')
+
         try:
-            self._send_campaign(newsletter, list_id)
+            with metrics.timer('courriers_send_seconds', backend=backend):
+                self._send_campaign(newsletter, list_id)
         except Exception as e:
+            metrics.incr('courriers_provider_errors_total', backend=backend, operation='send_campaign')
+            metrics.incr('courriers_campaigns_failed_total', backend=backend)
+
             logger.exception(e)
 
             if not FAIL_SILENTLY:
                 raise e
         else:
-            newsletter.sent = True
-            update_fields(newsletter, fields=('sent', ))
+            metrics.incr('courriers_campaigns_sent_total', backend=backend)
+
+            sent = True
+        finally:
+            translation.activate(old_language)
 
-        translation.activate(old_language)
+        return sent
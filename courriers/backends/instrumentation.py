@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+import time
+
+import six
+
+from .. import metrics
+from ..settings import PROVIDER_SLOW_CALL_THRESHOLD
+
+logger = logging.getLogger('courriers')
+
+# Attribute values returned as is instead of being wrapped
+PLAIN_TYPES = six.string_types + six.integer_types + (bytes, float, bool, type(None), dict, list, tuple, set)
+
+
+class CallStats(object):
+    """
+    Counts the provider calls of the process and their latency
+    by backend and endpoint.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+
+    def record(self, backend, endpoint, seconds, failed=False):
+        with self.lock:
+            stats = self.calls.setdefault((backend, endpoint), {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+
+            stats['count'] += 1
+            stats['errors'] += int(failed)
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+
+    def get(self, backend, endpoint):
+        return dict(self.calls.get((backend, endpoint), {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0}))
+
+    def count(self, backend, endpoint=None):
+        return sum(stats['count'] for (call_backend, call_endpoint), stats in self.calls.items()
+                   if call_backend == backend and endpoint in (None, call_endpoint))
+
+
+call_stats = CallStats()
+
+
+def payload_size(args, kwargs):
+    try:
+        return len(json.dumps([args, kwargs], default=repr).encode('utf-8'))
+    except (TypeError, ValueError):
+        return -1
+
+
+class InstrumentedClient(object):
+    """
+    Wraps a provider SDK client, ``client.lists.subscribe(...)`` is timed
+    and recorded as the ``lists.subscribe`` endpoint of ``backend``.
+    """
+    def __init__(self, client, backend, path=()):
+        self._client = client
+        self._backend = backend
+        self._path = path
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+
+        if isinstance(value, PLAIN_TYPES):
+            return value
+
+        return InstrumentedClient(value, self._backend, self._path + (name, ))
+
+    def __call__(self, *args, **kwargs):
+        endpoint = '.'.join(self._path)
+
+        failed = True
+        start = time.time()
+
+        try:
+            result = self._client(*args, **kwargs)
+
+            failed = False
+
+            return result
+        finally:
+            seconds = time.time() - start
+
+            call_stats.record(self._backend, endpoint, seconds, failed)
+
+            metrics.observe('courriers_provider_request_seconds', seconds, backend=self._backend, endpoint=endpoint)
+
+            if seconds >= PROVIDER_SLOW_CALL_THRESHOLD:
+                # The payload is only measured for slow calls
+                logger.warning('Slow %s call to %s: %.3fs with a %d bytes payload',
+                               self._backend, endpoint, seconds, payload_size(args, kwargs))
+
+
+def instrument(client, backend):
+    return InstrumentedClient(client, backend)
@@ -3,28 +3,38 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 
-from django.template.loader import render_to_string
+import six
+
+from django.utils import translation
 from django.utils.translation import ugettext as _
 from django.utils.functional import cached_property
 from django.core.exceptions import ImproperlyConfigured
 
 from .campaign import CampaignBackend
-from ..settings import (MAILCHIMP_API_KEY, PRE_PROCESSORS,
-                        DEFAULT_FROM_EMAIL, DEFAULT_FROM_NAME)
+from .instrumentation import instrument
+from ..models import NewsletterEvent, NewsletterSnapshot
+from ..settings import MAILCHIMP_API_KEY, DEFAULT_FROM_EMAIL, DEFAULT_FROM_NAME
 from ..utils import load_class
 
-from mailchimp import Mailchimp
-
 logger = logging.getLogger('courriers')
 
 
 class MailchimpBackend(CampaignBackend):
-    mailchimp_class = Mailchimp
+    # The SDK is imported when the backend is instantiated
+    mailchimp_class = 'mailchimp.Mailchimp'
+    # Webhook events whose list ids are the ones of this backend
+    event_source = NewsletterEvent.SOURCE_MAILCHIMP
 
     def __init__(self):
         if not MAILCHIMP_API_KEY:
             raise ImproperlyConfigured(_('Please specify your MAILCHIMP API key in Django settings'))
-        self.mc = self.mailchimp_class(MAILCHIMP_API_KEY, True)
+
+        mailchimp_class = self.mailchimp_class
+
+        if isinstance(mailchimp_class, six.string_types):
+            mailchimp_class = load_class(mailchimp_class)
+
+        self.mc = instrument(mailchimp_class(MAILCHIMP_API_KEY, True), self.__class__.__name__)
 
     @cached_property
     def list_ids(self):
@@ -39,6 +49,16 @@ class MailchimpBackend(CampaignBackend):
         self.mc.lists.unsubscribe(list_id, {'email': email}, delete_member=False,
                                   send_goodbye=False, send_notify=False)
 
+    def _subscribe_many(self, list_id, emails):
+        self.mc.lists.batch_subscribe(list_id, [{'email': {'email': email}, 'email_type': 'html'}
+                                                for email in emails],
+                                      double_optin=False, update_existing=False,
+                                      replace_interests=True)
+
+    def _unsubscribe_many(self, list_id, emails):
+        self.mc.lists.batch_unsubscribe(list_id, [{'email': email} for email in emails],
+                                        delete_member=False, send_goodbye=False, send_notify=False)
+
     def _send_campaign(self, newsletter, list_id):
         options = {
             'list_id': list_id,
@@ -47,17 +67,10 @@ class MailchimpBackend(CampaignBackend):
             'from_name': DEFAULT_FROM_NAME
         }
 
-        html = render_to_string('courriers/newsletter_raw_detail.html', {
-            'object': newsletter,
-            'items': newsletter.items.select_related('newsletter'),
-            'options': options
-        })
-
-        for pre_processor in PRE_PROCESSORS:
-            html = load_class(pre_processor)(html)
+        snapshot = NewsletterSnapshot.objects.get_for(newsletter, translation.get_language())
 
         content = {
-            'html': html
+            'html': snapshot.html
         }
 
         campaign = self.mc.campaigns.create('regular', options, content, segment_opts=None, type_opts=None)
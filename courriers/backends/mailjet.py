@@ -3,7 +3,7 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 
-from django.template.loader import render_to_string
+from django.utils import translation
 from django.utils.translation import ugettext as _
 from django.utils.functional import cached_property
 from django.core.exceptions import ImproperlyConfigured
@@ -14,17 +14,18 @@ except ImportError:
     from django.utils.encoding import smart_text as smart_unicode
 
 from .campaign import CampaignBackend
+from .instrumentation import instrument
+from ..models import NewsletterEvent, NewsletterSnapshot
 from ..settings import (MAILJET_API_KEY, MAILJET_API_SECRET_KEY,
-                        DEFAULT_FROM_EMAIL, DEFAULT_FROM_NAME,
-                        PRE_PROCESSORS)
-from ..utils import load_class
-
-import mailjet
+                        DEFAULT_FROM_EMAIL, DEFAULT_FROM_NAME)
 
 logger = logging.getLogger('courriers')
 
 
 class MailjetBackend(CampaignBackend):
+    # Webhook events whose list ids are the ones of this backend
+    event_source = NewsletterEvent.SOURCE_MAILJET
+
     def __init__(self):
         if not MAILJET_API_KEY:
             raise ImproperlyConfigured(_('Please specify your MAILJET API key in Django settings'))
@@ -32,7 +33,10 @@ class MailjetBackend(CampaignBackend):
         if not MAILJET_API_SECRET_KEY:
             raise ImproperlyConfigured(_('Please specify your MAILJET API SECRET key in Django settings'))
 
-        self.mailjet_api = mailjet.Api(api_key=MAILJET_API_KEY, secret_key=MAILJET_API_SECRET_KEY)
+        import mailjet
+
+        self.mailjet_api = instrument(mailjet.Api(api_key=MAILJET_API_KEY, secret_key=MAILJET_API_SECRET_KEY),
+                                      self.__class__.__name__)
 
     @cached_property
     def list_ids(self):
@@ -52,6 +56,20 @@ class MailjetBackend(CampaignBackend):
             method='POST'
         )
 
+    def _subscribe_many(self, list_id, emails):
+        self.mailjet_api.lists.addmanycontacts(
+            contacts=','.join(emails),
+            id=list_id,
+            method='POST'
+        )
+
+    def _unsubscribe_many(self, list_id, emails):
+        self.mailjet_api.lists.removemanycontacts(
+            contacts=','.join(emails),
+            id=list_id,
+            method='POST'
+        )
+
     def _send_campaign(self, newsletter, list_id):
         options = {
             'method': 'POST',
@@ -63,26 +81,15 @@ class MailjetBackend(CampaignBackend):
             'footer': 'default'
         }
 
-        html = render_to_string('courriers/newsletter_raw_detail.html', {
-            'object': newsletter,
-            'items': newsletter.items.select_related('newsletter'),
-            'options': options
-        })
+        snapshot = NewsletterSnapshot.objects.get_for(newsletter, translation.get_language())
 
         campaign = self.mailjet_api.message.createcampaign(**options)
 
-        for pre_processor in PRE_PROCESSORS:
-            html = load_class(pre_processor)(html)
-
         extra = {
             'method': 'POST',
             'id': campaign['campaign']['id'],
-            'html': smart_unicode(html).encode('utf-8'),
-            'text': smart_unicode(render_to_string('courriers/newsletter_raw_detail.txt', {
-                'object': newsletter,
-                'items': newsletter.items.select_related('newsletter'),
-                'options': options
-            })).encode('utf-8')
+            'html': smart_unicode(snapshot.html).encode('utf-8'),
+            'text': smart_unicode(snapshot.text).encode('utf-8')
         }
 
         self.mailjet_api.message.sethtmlcampaign(**extra)
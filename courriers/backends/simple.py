@@ -1,34 +1,116 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import operator
+import re
+
+from functools import reduce
+
 from .base import BaseBackend
 
-from django.template.loader import render_to_string
+from django.conf import settings
 from django.core import mail
 from django.core.mail import EmailMultiAlternatives
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, router
+from django.db.models import Q
 from django.utils import translation
+from django.utils import timezone as datetime
+from django.utils.encoding import force_bytes
+
+from .. import metrics
+from ..cache import cache, invalidate_subscriptions, subscription_status_key
+from ..models import NewsletterSendShard, NewsletterSubscriber, NewsletterSubscriberCount, NewsletterSnapshot
+from ..rendering import render_messages, render_newsletter
+from ..scheduler import deliver_shards, finish_shards
+from ..settings import (DEFAULT_FROM_EMAIL, EMAIL_BACKEND, RENDER_PER_SUBSCRIBER, RENDER_PROCESSES, RENDER_QUEUE_SIZE,
+                        SITE_URL, SUBSCRIPTION_STATUS_CACHE_TIMEOUT)
+from ..signatures import get_signer, set_boundaries, sign_message
+from ..tokens import make_unsubscribe_token
+from ..compat import atomic
+from ..exceptions import DuplicateSendError
+
+
+# Unsubscribe placeholder of the default templates, [[UNSUB_LINK_EN]]
+UNSUBSCRIBE_LINK_RE = re.compile(r'\[\[UNSUB_LINK_[A-Z]+\]\]')
+
+
+class RenderedEmailMessage(EmailMultiAlternatives):
+    """
+    Keeps the MIME message built by ``prepare()``, so that a render
+    worker hands a finished message to the sending process. The message
+    is DKIM signed when ``DKIM_DOMAIN`` is set.
+    """
+    mime = None
+
+    # Messages of the same variant have the same body, its DKIM
+    # body hash is computed once
+    variant = None
+
+    def prepare(self):
+        self.mime = self.message()
 
-from ..models import NewsletterSubscriber
-from ..settings import DEFAULT_FROM_EMAIL, PRE_PROCESSORS
-from ..utils import load_class
-from ..compat import update_fields
+        return self
+
+    def message(self):
+        if self.mime is not None:
+            return self.mime
+
+        mime = super(RenderedEmailMessage, self).message()
+
+        signer = get_signer()
+
+        if signer is None:
+            return mime
+
+        if self.variant is not None:
+            set_boundaries(mime, self.variant)
+
+        return sign_message(mime, self.variant, signer)
 
 
 class SimpleBackend(BaseBackend):
     model = NewsletterSubscriber
+    email_chunk_size = 100
+    # send_mails can deliver a range of subscribers
+    batched_sends = True
+
+    def subscribe(self, email, newsletter_list, lang=None, user=None, using=None):
+        using = self._write_alias(using)
+
+        # NULL languages would escape the unique constraint
+        lang = lang or ''
+
+        try:
+            with atomic(using=using):
+                return self._manager(using).create(email=email, user=user,
+                                                   newsletter_list=newsletter_list, lang=lang)
+        except IntegrityError:
+            # A concurrent registration already created this subscription
+            subscriber = self._manager(using).get(email=email, newsletter_list=newsletter_list, lang=lang)
 
-    def subscribe(self, email, newsletter_list, lang=None, user=None):
-        return self.model.objects.create(email=email, user=user,
-                                         newsletter_list=newsletter_list, lang=lang)
+            if subscriber.is_unsubscribed:
+                subscriber.subscribe()
 
-    def register(self, email, newsletter_list, lang=None, user=None):
-        if not self.exists(email, newsletter_list, lang=lang):
-            subscriber = self.subscribe(email, newsletter_list, lang, user)
+            return subscriber
+
+    def register(self, email, newsletter_list, lang=None, user=None, using=None):
+        using = self._write_alias(using)
+
+        self._count_subscriptions('subscribe')
+
+        if not self.exists(email, newsletter_list, lang=lang, using=using):
+            subscriber = self.subscribe(email, newsletter_list, lang, user, using=using)
         else:
-            for subscriber in self.all(email=email, newsletter_list=newsletter_list, lang=lang):
+            for subscriber in self.all(email=email, newsletter_list=newsletter_list, lang=lang, using=using):
                 if subscriber.is_unsubscribed:
                     subscriber.subscribe()
 
-    def unregister(self, email, newsletter_list=None, user=None, lang=None):
-        qs = self.model.objects.filter(email__iexact=email)
+    def unregister(self, email, newsletter_list=None, user=None, lang=None, using=None):
+        using = self._write_alias(using)
+
+        self._count_subscriptions('unsubscribe')
+
+        qs = self._manager(using).filter(email__iexact=email)
 
         if lang:
             qs = qs.filter(lang=lang)
@@ -37,15 +119,178 @@ class SimpleBackend(BaseBackend):
             for subscriber in qs:
                 subscriber.unsubscribe(commit=True)
         else:
-            if self.exists(email, newsletter_list):
+            if self.exists(email, newsletter_list, using=using):
                 for subscriber in qs.filter(newsletter_list=newsletter_list):
                     subscriber.unsubscribe(commit=True)
 
-    def exists(self, email, newsletter_list=None, user=None, lang=None):
-        return self.all(email, user=user, lang=lang, newsletter_list=newsletter_list).exists()
+    def bulk_register(self, emails, newsletter_list, lang=None, user_ids=None, using=None):
+        user_ids = user_ids or {}
+        using = self._write_alias(using)
+        lang = lang or ''
+
+        self._count_subscriptions('subscribe', len(emails))
+
+        qs = self._manager(using).filter(newsletter_list=newsletter_list)
+
+        if lang:
+            qs = qs.filter(lang=lang)
+
+        existing = set()
+        resubscribed = {}
+
+        rows = self._filter_emails(qs.values_list('pk', 'email', 'is_unsubscribed', 'lang'), emails)
+
+        for pk, email, is_unsubscribed, subscriber_lang in rows:
+            existing.add(email.lower())
+
+            if is_unsubscribed:
+                resubscribed.setdefault(subscriber_lang, []).append(pk)
+
+        resubscribed = self._update_status(newsletter_list.pk, resubscribed, is_unsubscribed=False, using=using)
+
+        subscribers = {}
+
+        for email in emails:
+            key = email.lower()
+
+            if key not in existing and key not in subscribers:
+                subscribers[key] = self.model(email=email,
+                                              user_id=user_ids.get(email),
+                                              newsletter_list=newsletter_list,
+                                              lang=lang)
+
+        if subscribers:
+            try:
+                with atomic(using=using):
+                    self._manager(using).bulk_create(list(subscribers.values()))
+            except IntegrityError:
+                for subscriber in subscribers.values():
+                    self.subscribe(subscriber.email, newsletter_list, lang, subscriber.user, using=using)
+            else:
+                NewsletterSubscriberCount.objects.adjust(newsletter_list.pk, lang, subscribed=len(subscribers),
+                                                         using=using)
+
+        if SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            invalidate_subscriptions(emails)
+
+        return len(subscribers) + resubscribed
+
+    def bulk_unregister(self, emails, newsletter_list=None, lang=None, using=None):
+        using = self._write_alias(using)
+
+        self._count_subscriptions('unsubscribe', len(emails))
+
+        qs = self._manager(using).subscribed()
+
+        if lang:
+            qs = qs.filter(lang=lang)
+
+        if newsletter_list:
+            qs = qs.filter(newsletter_list=newsletter_list)
+
+        groups = {}
+
+        for pk, newsletter_list_id, subscriber_lang in self._filter_emails(qs.values_list('pk', 'newsletter_list', 'lang'), emails):
+            groups.setdefault(newsletter_list_id, {}).setdefault(subscriber_lang, []).append(pk)
+
+        count = 0
+
+        for newsletter_list_id, pks_by_lang in groups.items():
+            count += self._update_status(newsletter_list_id, pks_by_lang,
+                                         is_unsubscribed=True, unsubscribed_at=datetime.now(), using=using)
+
+        if count and SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            invalidate_subscriptions(emails)
+
+        return count
+
+    def _update_status(self, newsletter_list_id, pks_by_lang, is_unsubscribed, using, **values):
+        """
+        Moves the subscribers of ``newsletter_list_id`` grouped by language
+        to ``is_unsubscribed`` and updates the counters, returns the number
+        of subscribers which changed.
+        """
+        count = 0
+
+        for lang, pks in pks_by_lang.items():
+            changed = (self._manager(using)
+                       .filter(pk__in=pks, is_unsubscribed=not is_unsubscribed)
+                       .update(is_unsubscribed=is_unsubscribed, **values))
+
+            delta = -changed if is_unsubscribed else changed
+
+            NewsletterSubscriberCount.objects.adjust(newsletter_list_id, lang,
+                                                     subscribed=delta, unsubscribed=-delta, using=using)
+
+            count += changed
+
+        return count
+
+    def unregister_subscriber(self, subscriber_id, newsletter_list_id, lang=None, using=None):
+        """
+        Cancels the subscription ``subscriber_id`` known from a signed token,
+        without reading it first.
+        """
+        using = self._write_alias(using)
+
+        self._count_subscriptions('unsubscribe')
+
+        count = self._update_status(newsletter_list_id, {lang: [subscriber_id]},
+                                    is_unsubscribed=True, unsubscribed_at=datetime.now(), using=using)
+
+        if count and SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            invalidate_subscriptions(self._manager(using).filter(pk=subscriber_id).values_list('email', flat=True))
+
+        return count
+
+    def bulk_bounce(self, emails, using=None):
+        """
+        Stops mailing ``emails`` on every list.
+        """
+        using = self._write_alias(using)
+
+        pks = [pk for pk, in self._filter_emails(self._manager(using).filter(is_bounced=False).values_list('pk'), emails)]
+
+        if pks:
+            self._manager(using).filter(pk__in=pks).update(is_bounced=True)
+
+        return len(pks)
+
+    def get_unsubscribe_url(self, subscriber):
+        return '%s%s' % (SITE_URL.rstrip('/'),
+                         reverse('newsletter_one_click_unsubscribe',
+                                 kwargs={'token': make_unsubscribe_token(subscriber)}))
+
+    def _count_subscriptions(self, action, count=1):
+        metrics.incr('courriers_subscriptions_total', count, backend=self.__class__.__name__, action=action)
 
-    def all(self, email, user=None, lang=None, newsletter_list=None):
-        qs = self.model.objects.filter(email__iexact=email).select_related('newsletter_list')
+    def _manager(self, using=None):
+        return self.model.objects.db_manager(using)
+
+    def _write_alias(self, using=None):
+        # Lookups made before a write read the database written to,
+        # replicas may lag behind.
+        return using or router.db_for_write(self.model)
+
+    def _filter_emails(self, qs, emails):
+        """
+        Yields the rows of ``qs`` matching one of ``emails`` case insensitively,
+        running one query per ``email_chunk_size`` emails.
+        """
+        emails = list(emails)
+
+        for i in range(0, len(emails), self.email_chunk_size):
+            filter_q = reduce(operator.or_, [Q(email__iexact=email)
+                                             for email in emails[i:i + self.email_chunk_size]])
+
+            for row in qs.filter(filter_q):
+                yield row
+
+    def exists(self, email, newsletter_list=None, user=None, lang=None, using=None):
+        return self.all(email, user=user, lang=lang, newsletter_list=newsletter_list, using=using).exists()
+
+    def all(self, email, user=None, lang=None, newsletter_list=None, using=None):
+        qs = self._manager(using).filter(email__iexact=email).select_related('newsletter_list')
 
         if user:
             qs = qs.filter(user=user)
@@ -58,55 +303,242 @@ class SimpleBackend(BaseBackend):
 
         return qs
 
-    def subscribed(self, email, newsletter_list=None, user=None, lang=None):
-        return (self.all(email, user=user, lang=lang, newsletter_list=newsletter_list)
+    def subscription_status(self, email, newsletter_list=None, lang=None, user=None, using=None):
+        """
+        Returns ``NewsletterSubscriber.STATUS_SUBSCRIBED`` if one of the
+        subscriptions of ``email`` to ``newsletter_list`` is active,
+        ``NewsletterSubscriber.STATUS_UNSUBSCRIBED`` if they are all cancelled
+        and ``None`` when there is no subscription at all. Like ``exists``,
+        only the subscriptions of ``user`` are considered when given, and
+        those to every list without ``newsletter_list``.
+        """
+        if SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            key = subscription_status_key(email, getattr(newsletter_list, 'pk', None), lang, getattr(user, 'pk', None))
+
+            status = cache().get(key)
+
+            if status is not None:
+                return status or None
+
+        qs = self._manager(using).filter(email__iexact=email)
+
+        if newsletter_list:
+            qs = qs.filter(newsletter_list=newsletter_list)
+
+        if user:
+            qs = qs.filter(user=user)
+
+        if lang:
+            qs = qs.filter(lang=lang)
+
+        # Active subscriptions come first
+        states = list(qs.order_by('is_unsubscribed').values_list('is_unsubscribed', flat=True)[:1])
+
+        if not states:
+            status = None
+        elif states[0]:
+            status = self.model.STATUS_UNSUBSCRIBED
+        else:
+            status = self.model.STATUS_SUBSCRIBED
+
+        if SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            cache().set(key, status or 0, SUBSCRIPTION_STATUS_CACHE_TIMEOUT)
+
+        return status
+
+    def subscribed(self, email, newsletter_list=None, user=None, lang=None, using=None):
+        return (self.all(email, user=user, lang=lang, newsletter_list=newsletter_list, using=using)
                 .filter(is_unsubscribed=False)
                 .exists())
 
-    def send_mails(self, newsletter, fail_silently=False):
-        qs = self.model.objects.filter(newsletter_list=newsletter.newsletter_list).subscribed()
+    def get_subscribers(self, newsletter, using=None):
+        qs = self._manager(using).filter(newsletter_list=newsletter.newsletter_list_id).deliverable()
 
         if newsletter.languages:
-            subscribers = qs.has_langs(newsletter.languages).prefetch_related('user')
-        else:
-            subscribers = qs.prefetch_related('user')
+            qs = qs.has_langs(newsletter.languages)
+
+        return qs
+
+    def send_mails(self, newsletter, fail_silently=False, pk_range=None, using=None):
+        """
+        Sends ``newsletter`` to its subscribers, read from the ``using``
+        database when given.
+        """
+        if pk_range:
+            # A batch of a claimed send
+            if not newsletter.heartbeat():
+                raise DuplicateSendError('The send of the newsletter "%s" was stopped.' % newsletter)
+
+            return self._send_mails(newsletter, fail_silently, pk_range, using=using)
+
+        if not newsletter.claim_send():
+            raise DuplicateSendError('The newsletter "%s" is being sent or was already sent.' % newsletter)
+
+        try:
+            # The progress is recorded in a shard, a stalled or failed
+            # send resumes after its last checkpoint
+            NewsletterSendShard.objects.prepare(newsletter, [(0, None)])
+
+            count = deliver_shards(self, newsletter, using=using, fail_silently=fail_silently)
+        except DuplicateSendError:
+            raise
+        except Exception:
+            newsletter.finish_send(failed=True)
+            raise
+
+        finish_shards(newsletter)
+
+        return count
+
+    def _send_mails(self, newsletter, fail_silently=False, pk_range=None, using=None):
+        subscribers = self.get_subscribers(newsletter, using=using).prefetch_related('user')
 
-        connection = mail.get_connection(fail_silently=fail_silently)
+        if pk_range:
+            start, end = pk_range
+
+            subscribers = subscribers.filter(pk__gte=start)
+
+            if end is not None:
+                subscribers = subscribers.filter(pk__lt=end)
+
+        connection = mail.get_connection(EMAIL_BACKEND, fail_silently=fail_silently)
+
+        backend = self.__class__.__name__
+
+        if RENDER_PER_SUBSCRIBER and RENDER_PROCESSES > 1:
+            return self._send_rendered_mails(newsletter, subscribers, connection)
 
         emails = []
 
+        contents = {}
+
         old_language = translation.get_language()
 
         for subscriber in subscribers:
-            translation.activate(subscriber.lang)
+            lang = self.get_language(newsletter, subscriber)
+
+            translation.activate(lang)
+
+            if RENDER_PER_SUBSCRIBER:
+                with metrics.timer('courriers_render_seconds', backend=backend):
+                    html, text = render_newsletter(newsletter, {'subscriber': subscriber})
+
+                variant = None
+            else:
+                if lang not in contents:
+                    with metrics.timer('courriers_render_seconds', backend=backend):
+                        snapshot = NewsletterSnapshot.objects.get_for(newsletter, lang)
+
+                    variant = hashlib.sha1(force_bytes(snapshot.html + snapshot.text)).hexdigest()
+
+                    contents[lang] = (snapshot.html, snapshot.text, variant)
+
+                html, text, variant = contents[lang]
+
+            emails.append(self.build_message(newsletter, subscriber, html, text, connection=connection,
+                                             variant=variant))
+
+        if old_language:
+            translation.activate(old_language)
+        else:
+            translation.deactivate()
+
+        return self._deliver(connection, emails)
+
+    def get_language(self, newsletter, subscriber):
+        """
+        Returns the language of the messages of ``subscriber``, subscribers
+        without language get the one of the newsletter when it has a single
+        one, the default language otherwise.
+        """
+        if subscriber.lang:
+            return subscriber.lang
+
+        languages = newsletter.languages or []
 
-            email = EmailMultiAlternatives(newsletter.name,
-                                           render_to_string('courriers/newsletter_raw_detail.txt', {
-                                               'object': newsletter,
-                                               'subscriber': subscriber
-                                           }),
-                                           DEFAULT_FROM_EMAIL,
-                                           [subscriber.email, ],
-                                           connection=connection)
+        if len(languages) == 1:
+            return languages[0]
 
-            html = render_to_string('courriers/newsletter_raw_detail.html', {
-                'object': newsletter,
-                'items': newsletter.items.all().prefetch_related('newsletter'),
-                'subscriber': subscriber
-            })
+        return settings.LANGUAGE_CODE
 
-            for pre_processor in PRE_PROCESSORS:
-                html = load_class(pre_processor)(html)
+    def _send_rendered_mails(self, newsletter, subscribers, connection):
+        """
+        Renders the messages in ``RENDER_PROCESSES`` processes and sends
+        them by chunks of ``email_chunk_size`` while the next ones render.
+        """
+        backend = self.__class__.__name__
 
-            email.attach_alternative(html, 'text/html')
+        # Loaded before forking so the workers do not query them
+        newsletter.get_items()
+        newsletter.newsletter_list
+
+        count = 0
+        emails = []
+
+        for email, seconds in render_messages(self, newsletter, subscribers, RENDER_PROCESSES, RENDER_QUEUE_SIZE):
+            metrics.observe('courriers_render_seconds', seconds, backend=backend)
 
             emails.append(email)
 
-        translation.activate(old_language)
+            if len(emails) >= self.email_chunk_size:
+                count += self._deliver(connection, emails) or 0
+                emails = []
+
+        if emails:
+            count += self._deliver(connection, emails) or 0
+
+        return count
+
+    def build_message(self, newsletter, subscriber, html, text, connection=None, variant=None):
+        """
+        Builds the message of ``subscriber``, ``variant`` identifies
+        the ``html`` and ``text`` contents shared by several subscribers.
+        """
+        headers = {}
+
+        if SITE_URL:
+            unsubscribe_url = self.get_unsubscribe_url(subscriber)
+
+            html, html_links = UNSUBSCRIBE_LINK_RE.subn(unsubscribe_url, html)
+            text, text_links = UNSUBSCRIBE_LINK_RE.subn(unsubscribe_url, text)
+
+            if html_links or text_links:
+                # The body is personal
+                variant = None
+
+            # RFC 8058 one-click unsubscribe
+            headers['List-Unsubscribe'] = '<%s>' % unsubscribe_url
+            headers['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
+
+        email = RenderedEmailMessage(newsletter.name,
+                                     text,
+                                     DEFAULT_FROM_EMAIL,
+                                     [subscriber.email, ],
+                                     connection=connection,
+                                     headers=headers)
+
+        email.attach_alternative(html, 'text/html')
+
+        email.variant = variant
+
+        return email
+
+    def _deliver(self, connection, emails):
+        backend = self.__class__.__name__
+
+        metrics.incr('courriers_messages_rendered_total', len(emails), backend=backend)
+
+        try:
+            with metrics.timer('courriers_send_seconds', backend=backend):
+                results = connection.send_messages(emails)
+        except Exception:
+            metrics.incr('courriers_messages_failed_total', len(emails), backend=backend)
+            raise
 
-        results = connection.send_messages(emails)
+        # The connections failing silently return the number of delivered messages
+        sent = len(emails) if results is None else results
 
-        newsletter.sent = True
-        update_fields(newsletter, fields=('sent', ))
+        metrics.incr('courriers_messages_sent_total', sent, backend=backend)
+        metrics.incr('courriers_messages_failed_total', len(emails) - sent, backend=backend)
 
         return results
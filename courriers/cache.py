@@ -0,0 +1,109 @@
+import hashlib
+import time
+
+from .compat import get_cache
+from .settings import CACHE_ALIAS
+
+
+def cache():
+    return get_cache(CACHE_ALIAS)
+
+
+def make_key(*parts):
+    return 'courriers:%s' % ':'.join('%s' % ('' if part is None else part) for part in parts)
+
+
+def hash_email(email):
+    return hashlib.md5(email.lower().encode('utf-8')).hexdigest()
+
+
+def new_version():
+    # Versions are timestamps so that an evicted version key never resurrects
+    # values stored under a previous version.
+    return int(time.time() * 1000000)
+
+
+def get_version(key):
+    return get_versions([key])[0]
+
+
+def get_versions(keys):
+    versions = cache().get_many(keys)
+
+    for key in keys:
+        if versions.get(key) is None:
+            version = new_version()
+
+            if not cache().add(key, version):
+                version = cache().get(key, version)
+
+            versions[key] = version
+
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    version = new_version()
+
+    cache().set_many(dict((key, version) for key in keys))
+
+
+def subscription_version_key(email):
+    return make_key('subscription', 'version', hash_email(email))
+
+
+def subscription_status_key(email, newsletter_list_id, lang=None, user_id=None):
+    return make_key('subscription', 'status', hash_email(email),
+                    get_version(subscription_version_key(email)),
+                    newsletter_list_id, lang, user_id)
+
+
+def invalidate_subscriptions(emails):
+    bump_versions([subscription_version_key(email) for email in emails])
+
+
+def archive_version_key(slug=None):
+    return make_key('archive', 'version', slug)
+
+
+def archive_page_key(slug, lang, page, ajax=False):
+    versions = get_versions([archive_version_key(), archive_version_key(slug)])
+
+    return make_key('archive', 'page', '-'.join('%s' % version for version in versions),
+                    slug, lang, page, int(ajax))
+
+
+def invalidate_archive(slug=None):
+    """
+    Invalidates the archive pages of the newsletter list ``slug``,
+    or the pages of every list when no slug is given.
+    """
+    bump_versions([archive_version_key(slug)])
+
+
+def task_version_key(action, email):
+    return make_key('task', action, 'version', hash_email(email))
+
+
+def task_key(action, email, newsletter_list_id=None, lang=None):
+    return make_key('task', action, hash_email(email), get_version(task_version_key(action, email)),
+                    newsletter_list_id, lang)
+
+
+def claim_task(key, timeout, released_actions=(), email=None):
+    """
+    Returns ``False`` when a task with the same idempotency ``key`` is
+    already pending, otherwise claims it and forgets the pending tasks
+    of ``email`` for ``released_actions``, whatever their list or language.
+    """
+    if not cache().add(key, 1, timeout):
+        return False
+
+    if released_actions:
+        bump_versions([task_version_key(action, email) for action in released_actions])
+
+    return True
+
+
+def release_task(key):
+    cache().delete(key)
@@ -2,7 +2,7 @@ import django
 
 from django.conf import settings
 
-__all__ = ['update_fields', 'get_user_model']
+__all__ = ['update_fields', 'get_user_model', 'get_cache', 'atomic', 'get_arg_names']
 
 # Django 1.5+ compatibility
 if django.VERSION >= (1, 5):
@@ -17,4 +17,28 @@ else:
 
         return User
 
+# Django 1.6+ compatibility
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic  # noqa
+
+# Django 1.7+ compatibility
+try:
+    from django.core.cache import caches
+
+    get_cache = lambda alias: caches[alias]
+except ImportError:
+    from django.core.cache import get_cache  # noqa
+
+# Python 3.3+ compatibility
+try:
+    from inspect import signature
+
+    get_arg_names = lambda func: list(signature(func).parameters)
+except ImportError:
+    from inspect import getargspec
+
+    get_arg_names = lambda func: getargspec(func).args
+
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
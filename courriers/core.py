@@ -28,7 +28,7 @@ class QuerySet(BaseQuerySet):
 
 class Manager(models.Manager):
     def get_queryset(self):
-        return QuerySet(self.model)
+        return QuerySet(self.model, using=self._db)
 
     if django.VERSION < (1, 6):
         get_query_set = get_queryset
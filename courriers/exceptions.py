@@ -0,0 +1,5 @@
+class DuplicateSendError(Exception):
+    """
+    Raised when a newsletter is sent while another send of it is running
+    or once it has been sent.
+    """
@@ -2,8 +2,14 @@ from django import forms
 from django.utils.translation import ugettext_lazy as _, get_language
 
 from .backends import get_backend
-from .models import NewsletterSubscriber
-from .tasks import subscribe, unsubscribe
+from .cache import claim_task, task_key
+from .models import NewsletterSubscriber, NewsletterSubscriptionRequest
+from .settings import COALESCE_SUBSCRIPTIONS, IDEMPOTENCY_TIMEOUT
+from .utils import lazy_import
+
+# Celery is only imported when a form enqueues a task
+subscribe = lazy_import('courriers.tasks.subscribe')
+unsubscribe = lazy_import('courriers.tasks.unsubscribe')
 
 
 class SubscriptionForm(forms.Form):
@@ -26,23 +32,35 @@ class SubscriptionForm(forms.Form):
     def clean_receiver(self):
         receiver = self.cleaned_data['receiver']
 
-        if self.backend.exists(receiver, self.newsletter_list, user=self.user, lang=self.lang):
-            qs = NewsletterSubscriber.objects.filter(email__iexact=receiver,
-                                                     newsletter_list_id=self.newsletter_list.id)
-
-            if self.lang:
-                qs = qs.filter(lang=self.lang)
+        status = self.backend.subscription_status(receiver, self.newsletter_list, lang=self.lang, user=self.user)
 
-            if not qs.get().is_unsubscribed:
-                raise forms.ValidationError(_(u"You already subscribe to this newsletter."))
+        if status == NewsletterSubscriber.STATUS_SUBSCRIBED:
+            raise forms.ValidationError(_(u"You already subscribe to this newsletter."))
 
         return receiver
 
     def save(self, user=None):
-        subscribe.delay(email=self.cleaned_data['receiver'],
+        if COALESCE_SUBSCRIPTIONS:
+            NewsletterSubscriptionRequest.objects.subscribe(email=self.cleaned_data['receiver'],
+                                                            newsletter_list=self.newsletter_list,
+                                                            lang=self.lang,
+                                                            user=user or self.user)
+            return
+
+        email = self.cleaned_data['receiver']
+        newsletter_list_id = getattr(self.newsletter_list, 'pk', None)
+
+        idempotency_key = task_key('subscribe', email, newsletter_list_id, self.lang)
+
+        if IDEMPOTENCY_TIMEOUT:
+            if not claim_task(idempotency_key, IDEMPOTENCY_TIMEOUT, ['unsubscribe'], email):
+                return
+
+        subscribe.delay(email=email,
                         lang=self.lang,
-                        newsletter_list_id=getattr(self.newsletter_list, 'pk', None),
-                        user_id=getattr(user or self.user, 'pk', None))
+                        newsletter_list_id=newsletter_list_id,
+                        user_id=getattr(user or self.user, 'pk', None),
+                        idempotency_key=idempotency_key)
 
 
 class UnsubscribeForm(forms.Form):
@@ -72,10 +90,25 @@ class UnsubscribeForm(forms.Form):
     def save(self, user=None):
         from_all = self.cleaned_data.get('from_all', False)
 
+        if COALESCE_SUBSCRIPTIONS:
+            NewsletterSubscriptionRequest.objects.unsubscribe(email=self.cleaned_data['email'],
+                                                              newsletter_list=None if from_all else self.newsletter_list,
+                                                              user=user)
+            return
+
+        email = self.cleaned_data['email']
+
         if from_all or not self.newsletter_list:
-            unsubscribe.apply_async(kwargs={'email': self.cleaned_data['email'],
-                                            'user_id': getattr(user, 'pk', None)})
+            kwargs = {}
         else:
-            unsubscribe.apply_async(kwargs={'email': self.cleaned_data['email'],
-                                            'newsletter_list_id': self.newsletter_list.pk,
-                                            'user_id': getattr(user, 'pk', None)})
+            kwargs = {'newsletter_list_id': self.newsletter_list.pk}
+
+        kwargs['idempotency_key'] = task_key('unsubscribe', email, kwargs.get('newsletter_list_id'))
+
+        if IDEMPOTENCY_TIMEOUT:
+            if not claim_task(kwargs['idempotency_key'], IDEMPOTENCY_TIMEOUT, ['subscribe'], email):
+                return
+
+        kwargs.update({'email': email, 'user_id': getattr(user, 'pk', None)})
+
+        unsubscribe.apply_async(kwargs=kwargs)
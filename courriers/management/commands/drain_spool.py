@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = 'Relays the spooled newsletter messages'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--connections',
+                    action='store',
+                    type='int',
+                    dest='connections',
+                    default=None,
+                    help='Number of parallel relay connections'),
+        make_option('--limit',
+                    action='store',
+                    type='int',
+                    dest='limit',
+                    default=None,
+                    help='Maximum number of messages relayed per run'),
+        make_option('--loop',
+                    action='store_true',
+                    dest='loop',
+                    default=False,
+                    help='Keep draining the spool'),
+        make_option('--interval',
+                    action='store',
+                    type='int',
+                    dest='interval',
+                    default=5,
+                    help='Seconds between two runs with --loop'),
+    )
+
+    def handle(self, *args, **options):
+        from courriers.spool import Spool, drain
+
+        spool = Spool()
+
+        while True:
+            sent, failed = drain(spool, connections=options.get('connections'), limit=options.get('limit'))
+
+            if sent or failed:
+                self.stdout.write('%d messages relayed, %d refused' % (sent, failed))
+
+            if not options.get('loop'):
+                break
+
+            time.sleep(options.get('interval'))
@@ -38,6 +38,6 @@ class Command(BaseCommand):
         print "%d contacts to unsubscribe" % len(diff)
 
         for email in diff:
-            backend.unregister(email)
+            backend.unregister(email, using=self.connection)
 
             print "Unsubscribe user: %s" % email
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the subscriber counters of every list and language'
+
+    def handle(self, *args, **options):
+        from courriers.models import NewsletterSubscriberCount
+
+        count = NewsletterSubscriberCount.objects.rebuild()
+
+        self.stdout.write('%d counters rebuilt' % count)
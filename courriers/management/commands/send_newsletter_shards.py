@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    args = '<newsletter_id>'
+    help = 'Delivers the shards of a newsletter, several machines can run it at once'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--connection',
+                    action='store',
+                    dest='connection',
+                    default=None,
+                    help='Database to read the subscribers from'),
+    )
+
+    def handle(self, *args, **options):
+        from courriers.backends import get_backend
+        from courriers.models import Newsletter
+        from courriers.scheduler import send_shards
+
+        if len(args) != 1:
+            raise CommandError('Usage: send_newsletter_shards %s' % self.args)
+
+        try:
+            newsletter = Newsletter.objects.get(pk=args[0])
+        except (Newsletter.DoesNotExist, ValueError):
+            raise CommandError('Newsletter "%s" does not exist' % args[0])
+
+        try:
+            count = send_shards(get_backend()(), newsletter, using=options.get('connection'))
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write('%d subscribers delivered' % count)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = 'Sends the scheduled newsletters which are published'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--loop',
+                    action='store_true',
+                    dest='loop',
+                    default=False,
+                    help='Keep checking for due newsletters'),
+        make_option('--interval',
+                    action='store',
+                    type='int',
+                    dest='interval',
+                    default=60,
+                    help='Seconds between two checks with --loop'),
+    )
+
+    def handle(self, *args, **options):
+        from courriers.scheduler import dispatch_due_newsletters
+
+        while True:
+            for newsletter in dispatch_due_newsletters():
+                self.stdout.write('Sending newsletter: %s' % newsletter)
+
+            if not options.get('loop'):
+                break
+
+            time.sleep(options.get('interval'))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.utils.functional import cached_property
+
+from .settings import (METRICS_BUCKETS, METRICS_ENABLED, METRICS_SINKS,
+                       STATSD_HOST, STATSD_PORT, STATSD_PREFIX)
+from .utils import load_class
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join('%s="%s"' % (name, ('%s' % value).replace('\\', '\\\\')
+                                                              .replace('"', '\\"')
+                                                              .replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else '%s' % value
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        total = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+
+            yield bound, total
+
+
+class Registry(object):
+    """
+    Keeps counters, gauges and histograms in memory for the Prometheus
+    endpoint and forwards every update to the ``METRICS_SINKS``.
+    """
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or METRICS_BUCKETS)
+        self.lock = threading.Lock()
+        self.reset()
+
+    @cached_property
+    def sinks(self):
+        return [load_class(sink, 'COURRIERS_METRICS_SINKS')() for sink in METRICS_SINKS]
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def incr(self, name, value=1, **labels):
+        if not METRICS_ENABLED:
+            return
+
+        key = (name, _labels(labels))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        for sink in self.sinks:
+            sink.incr(name, value, labels)
+
+    def gauge(self, name, value, **labels):
+        if not METRICS_ENABLED:
+            return
+
+        with self.lock:
+            self.gauges[(name, _labels(labels))] = value
+
+        for sink in self.sinks:
+            sink.gauge(name, value, labels)
+
+    def observe(self, name, value, **labels):
+        if not METRICS_ENABLED:
+            return
+
+        key = (name, _labels(labels))
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+
+            self.histograms[key].observe(value)
+
+        for sink in self.sinks:
+            sink.timing(name, value, labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def get(self, name, **labels):
+        """
+        Returns the value of a counter or a gauge, ``0`` when it
+        was never updated.
+        """
+        key = (name, _labels(labels))
+
+        return self.counters.get(key, self.gauges.get(key, 0))
+
+    def get_histogram(self, name, **labels):
+        return self.histograms.get((name, _labels(labels)))
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+            lines = []
+            seen = set()
+
+            for metrics, kind in ((counters, 'counter'), (gauges, 'gauge')):
+                for (name, labels), value in metrics:
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append('# TYPE %s %s' % (name, kind))
+
+                    lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+
+            for (name, labels), histogram in histograms:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append('# TYPE %s histogram' % name)
+
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', _format_value(float(bound)))]),
+                                                     count))
+
+                lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', '+Inf')]), histogram.count))
+                lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(histogram.sum)))
+                lines.append('%s_count%s %s' % (name, _format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdSink(object):
+    """
+    Sends the metrics to StatsD over UDP, label values are appended
+    to the metric name.
+    """
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (host or STATSD_HOST, port or STATSD_PORT)
+        self.prefix = STATSD_PREFIX if prefix is None else prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format_name(self, name, labels):
+        parts = [self.prefix, name] + ['%s' % value for key, value in _labels(labels)]
+
+        return '.'.join(part.replace('.', '_').replace(':', '_') for part in parts if part)
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data.encode('utf-8'), self.address)
+        except (socket.error, UnicodeError):
+            # Metrics never break a send
+            pass
+
+    def incr(self, name, value, labels):
+        self.send('%s:%s|c' % (self.format_name(name, labels), value))
+
+    def gauge(self, name, value, labels):
+        self.send('%s:%s|g' % (self.format_name(name, labels), value))
+
+    def timing(self, name, seconds, labels):
+        self.send('%s:%d|ms' % (self.format_name(name, labels), seconds * 1000))
+
+
+registry = Registry()
+
+incr = registry.incr
+gauge = registry.gauge
+observe = registry.observe
+timer = registry.timer
+
+
+def update_queue_depths():
+    """
+    Counts the rows waiting in the database queues.
+    """
+    from .models import NewsletterEvent, NewsletterSendShard, NewsletterSubscriptionRequest
+
+    gauge('courriers_queue_depth', NewsletterSubscriptionRequest.objects.count(), queue='subscriptions')
+    gauge('courriers_queue_depth', NewsletterEvent.objects.count(), queue='events')
+    gauge('courriers_queue_depth',
+          NewsletterSendShard.objects.exclude(status=NewsletterSendShard.STATUS_DONE).count(),
+          queue='shards')
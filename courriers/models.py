@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
+import base64
 import os
+import uuid
+import zlib
+
 import django
+import six
 
-from django.db import models
+from django.conf import settings
+from django.db import models, router, IntegrityError
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 try:
     from django.contrib.contenttypes.fields import GenericForeignKey
 except ImportError:
@@ -12,12 +20,16 @@ except ImportError:
 from django.template.defaultfilters import slugify, truncatechars
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone as datetime
+from django.utils import translation
 from django.core.urlresolvers import reverse
-from django.utils.encoding import python_2_unicode_compatible
+from django.utils.encoding import python_2_unicode_compatible, force_bytes, force_text
 
-from .compat import update_fields, AUTH_USER_MODEL
+from .cache import invalidate_archive, invalidate_subscriptions
+from .compat import atomic, AUTH_USER_MODEL
 from .core import QuerySet, Manager
-from .settings import ALLOWED_LANGUAGES
+from .renditions import get_renditions
+from .settings import (ALLOWED_LANGUAGES, ARCHIVE_CACHE_TIMEOUT, BATCH_LEASE_TIMEOUT, RENDITIONS, SEND_HEARTBEAT_TIMEOUT,
+                       SUBSCRIPTION_STATUS_CACHE_TIMEOUT)
 
 from separatedvaluesfield.models import SeparatedValuesField
 
@@ -31,12 +43,14 @@ def get_file_path(instance, filename):
 
 class NewsletterListQuerySet(QuerySet):
     def has_lang(self, lang):
-        return self.filter(Q(languages__contains=lang) | Q(languages__isnull=True) | Q(languages=''))
+        return self.filter(pk__in=(NewsletterListLanguage.objects
+                                   .filter(lang__in=[lang, NewsletterListLanguage.ALL_LANGUAGES])
+                                   .values('newsletter_list')))
 
 
 class NewsletterListManager(Manager):
     def get_queryset(self):
-        return NewsletterListQuerySet(self.model)
+        return NewsletterListQuerySet(self.model, using=self._db)
 
     if django.VERSION < (1, 6):
         get_query_set = get_queryset
@@ -69,7 +83,9 @@ class NewsletterList(models.Model):
 
 class NewsletterQuerySet(QuerySet):
     def has_lang(self, lang):
-        return self.filter(Q(languages__contains=lang) | Q(languages__isnull=True) | Q(languages=''))
+        return self.filter(pk__in=(NewsletterLanguage.objects
+                                   .filter(lang__in=[lang, NewsletterLanguage.ALL_LANGUAGES])
+                                   .values('newsletter')))
 
     def status_online(self):
         return (self.filter(status=Newsletter.STATUS_ONLINE,
@@ -85,13 +101,47 @@ class NewsletterQuerySet(QuerySet):
     def get_next(self, current_date):
         return (self.status_online()
                 .filter(published_at__gt=current_date)
-                .order_by('-published_at')
+                .order_by('published_at')
                 .first())
 
+    def sendable(self):
+        return self.filter(Q(send_status__in=(Newsletter.SEND_STATUS_DRAFT, Newsletter.SEND_STATUS_FAILED)) |
+                           Q(pk__in=self.stalled().values('pk')))
+
+    def stalled(self):
+        """
+        Returns the sends whose process stopped beating
+        for ``SEND_HEARTBEAT_TIMEOUT`` seconds.
+        """
+        return self.filter(send_status=Newsletter.SEND_STATUS_SENDING,
+                           send_heartbeat_at__lt=datetime.now() - datetime.timedelta(seconds=SEND_HEARTBEAT_TIMEOUT))
+
+    def relink(self, newsletter_list_id, using=None):
+        """
+        Updates the previous and next pointers of the online newsletters
+        of a list, ordered by publication date. The pointers are read from
+        the write database, a replica could be behind.
+        """
+        qs = self.using(using or self._db or router.db_for_write(self.model))
+
+        rows = list(qs.filter(newsletter_list=newsletter_list_id, status=Newsletter.STATUS_ONLINE)
+                    .exclude(published_at=None)
+                    .order_by('published_at', 'pk')
+                    .values_list('pk', 'previous_newsletter', 'next_newsletter'))
+
+        for i, (pk, previous_id, next_id) in enumerate(rows):
+            siblings = (rows[i - 1][0] if i > 0 else None,
+                        rows[i + 1][0] if i + 1 < len(rows) else None)
+
+            if siblings != (previous_id, next_id):
+                # The links are part of the page, its version changes
+                qs.filter(pk=pk).update(previous_newsletter=siblings[0], next_newsletter=siblings[1],
+                                        updated_at=datetime.now())
+
 
 class NewsletterManager(Manager):
     def get_queryset(self):
-        return NewsletterQuerySet(self.model)
+        return NewsletterQuerySet(self.model, using=self._db)
 
     if django.VERSION < (1, 6):
         get_query_set = get_queryset
@@ -102,12 +152,21 @@ class NewsletterManager(Manager):
     def status_online(self):
         return self.get_queryset().status_online()
 
+    def sendable(self):
+        return self.get_queryset().sendable()
+
+    def stalled(self):
+        return self.get_queryset().stalled()
+
     def get_previous(self, current_date):
         return self.get_queryset().get_previous(current_date)
 
     def get_next(self, current_date):
         return self.get_queryset().get_next(current_date)
 
+    def relink(self, newsletter_list_id, using=None):
+        return self.get_queryset().relink(newsletter_list_id, using=using)
+
 
 @python_2_unicode_compatible
 class Newsletter(models.Model):
@@ -119,6 +178,22 @@ class Newsletter(models.Model):
         (STATUS_DRAFT, _('Draft')),
     )
 
+    SEND_STATUS_DRAFT = 1
+    SEND_STATUS_SENDING = 2
+    SEND_STATUS_SENT = 3
+    SEND_STATUS_FAILED = 4
+
+    SEND_STATUS_CHOICES = (
+        (SEND_STATUS_DRAFT, _('Draft')),
+        (SEND_STATUS_SENDING, _('Sending')),
+        (SEND_STATUS_SENT, _('Sent')),
+        (SEND_STATUS_FAILED, _('Failed')),
+    )
+
+    # Fields which do not change the rendered content
+    STATE_FIELDS = ('status', 'sent', 'scheduled', 'send_status', 'send_heartbeat_at',
+                    'previous_newsletter', 'next_newsletter')
+
     name = models.CharField(max_length=255)
     published_at = models.DateTimeField(null=True)
     status = models.PositiveIntegerField(choices=STATUS_CHOICES,
@@ -130,19 +205,104 @@ class Newsletter(models.Model):
     languages = SeparatedValuesField(max_length=50, blank=True, null=True, choices=ALLOWED_LANGUAGES)
     newsletter_list = models.ForeignKey(NewsletterList, related_name='newsletters')
     sent = models.BooleanField(default=False, db_index=True)
+    scheduled = models.BooleanField(default=False, db_index=True,
+                                    help_text=_('Send automatically once published'))
+    send_status = models.PositiveIntegerField(choices=SEND_STATUS_CHOICES,
+                                              default=SEND_STATUS_DRAFT,
+                                              editable=False,
+                                              db_index=True)
+    send_heartbeat_at = models.DateTimeField(null=True, editable=False)
+    previous_newsletter = models.ForeignKey('self', blank=True, null=True, editable=False,
+                                            related_name='+', on_delete=models.SET_NULL)
+    next_newsletter = models.ForeignKey('self', blank=True, null=True, editable=False,
+                                        related_name='+', on_delete=models.SET_NULL)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = NewsletterManager()
 
+    class Meta:
+        index_together = [('newsletter_list', 'status', 'published_at')]
+
     def __str__(self):
         return self.name
 
     def get_previous(self):
-        return (self.__class__.objects.filter(newsletter_list=self.newsletter_list_id)
-                .get_previous(self.published_at))
+        return self.get_siblings()[0]
 
     def get_next(self):
-        return (self.__class__.objects.filter(newsletter_list=self.newsletter_list_id)
-                .get_next(self.published_at))
+        return self.get_siblings()[1]
+
+    def get_siblings(self):
+        """
+        Returns the previous and the next online newsletters of the list
+        in a single query.
+        """
+        previous = next = None
+
+        for newsletter in (self.__class__.objects.status_online()
+                           .filter(Q(previous_newsletter=self.pk) | Q(next_newsletter=self.pk))):
+            if newsletter.next_newsletter_id == self.pk:
+                previous = newsletter
+            else:
+                next = newsletter
+
+        return previous, next
+
+    def get_items(self):
+        """
+        Returns the items of the newsletter with their content objects,
+        loaded once per instance with a query per content type.
+        """
+        if not hasattr(self, '_items_cache'):
+            self._items_cache = list(self.items.prefetch_related('content_object'))
+
+            for item in self._items_cache:
+                item.newsletter = self
+
+        return self._items_cache
+
+    def get_cover_renditions(self):
+        return get_renditions(self.cover)
+
+    def claim_send(self):
+        """
+        Moves the newsletter to the sending status, returns ``False`` when it
+        is being sent or was already sent. A stalled or failed send can be
+        claimed again and resumes after the checkpoints of its shards.
+        """
+        now = datetime.now()
+
+        values = {'send_status': self.SEND_STATUS_SENDING, 'send_heartbeat_at': now}
+
+        claimed = (self.__class__.objects
+                   .filter(pk=self.pk, send_status=self.SEND_STATUS_DRAFT)
+                   .update(**values))
+
+        if claimed:
+            # A draft is sent from the start
+            self.shards.all().delete()
+        else:
+            claimed = self.__class__.objects.sendable().filter(pk=self.pk).update(**values)
+
+        if claimed:
+            self.send_status, self.send_heartbeat_at = self.SEND_STATUS_SENDING, now
+
+        return bool(claimed)
+
+    def heartbeat(self):
+        self.send_heartbeat_at = datetime.now()
+
+        return bool(self.__class__.objects
+                    .filter(pk=self.pk, send_status=self.SEND_STATUS_SENDING)
+                    .update(send_heartbeat_at=self.send_heartbeat_at))
+
+    def finish_send(self, failed=False):
+        self.send_status = self.SEND_STATUS_FAILED if failed else self.SEND_STATUS_SENT
+        self.sent = self.sent or not failed
+
+        return bool(self.__class__.objects
+                    .filter(pk=self.pk, send_status=self.SEND_STATUS_SENDING)
+                    .update(send_status=self.send_status, sent=self.sent))
 
     def is_online(self):
         return self.status == self.STATUS_ONLINE
@@ -151,6 +311,280 @@ class Newsletter(models.Model):
         return reverse('newsletter_detail', args=[self.pk, ])
 
 
+class NewsletterSnapshotManager(Manager):
+    def get_for(self, newsletter, lang=None):
+        """
+        Returns the snapshot of ``newsletter`` in ``lang``,
+        rendering it when the newsletter changed since the last one.
+        """
+        from .rendering import render_newsletter
+
+        lang = lang or settings.LANGUAGE_CODE
+
+        try:
+            # A render which raced with an edit stored the previous version
+            return self.get(newsletter=newsletter, lang=lang, newsletter_updated_at=F('newsletter__updated_at'))
+        except self.model.DoesNotExist:
+            pass
+
+        using = router.db_for_write(self.model)
+
+        # Read before the render, a later edit makes the snapshot outdated
+        versions = list(Newsletter.objects.db_manager(using)
+                        .filter(pk=newsletter.pk)
+                        .values_list('updated_at', flat=True))
+
+        snapshot = self.model(newsletter=newsletter, lang=lang)
+
+        with translation.override(lang):
+            snapshot.html, snapshot.text = render_newsletter(newsletter)
+
+        if not versions:
+            # Not saved
+            return snapshot
+
+        snapshot.newsletter_updated_at = versions[0]
+
+        qs = self.db_manager(using).filter(newsletter=newsletter, lang=lang)
+
+        # The snapshot of a newer version rendered concurrently is kept
+        if qs.exclude(newsletter_updated_at__gt=snapshot.newsletter_updated_at).update(
+                compressed_html=snapshot.compressed_html,
+                compressed_text=snapshot.compressed_text,
+                newsletter_updated_at=snapshot.newsletter_updated_at):
+            return snapshot
+
+        try:
+            with atomic():
+                snapshot.save(using=using)
+        except IntegrityError:
+            # Rendered concurrently by another process
+            pass
+
+        return snapshot
+
+
+class NewsletterSnapshot(models.Model):
+    newsletter = models.ForeignKey(Newsletter, related_name='snapshots')
+    lang = models.CharField(max_length=10)
+    compressed_html = models.TextField()
+    compressed_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Version of the newsletter which was rendered
+    newsletter_updated_at = models.DateTimeField(null=True)
+
+    objects = NewsletterSnapshotManager()
+
+    class Meta:
+        unique_together = ('newsletter', 'lang')
+
+    @staticmethod
+    def compress(value):
+        return force_text(base64.b64encode(zlib.compress(force_bytes(value))))
+
+    @staticmethod
+    def decompress(value):
+        return force_text(zlib.decompress(base64.b64decode(value)))
+
+    @property
+    def html(self):
+        return self.decompress(self.compressed_html)
+
+    @html.setter
+    def html(self, value):
+        self.compressed_html = self.compress(value)
+
+    @property
+    def text(self):
+        return self.decompress(self.compressed_text)
+
+    @text.setter
+    def text(self, value):
+        self.compressed_text = self.compress(value)
+
+
+class NewsletterSendShardManager(Manager):
+    def prepare(self, newsletter, ranges, start_dates=None):
+        """
+        Creates the shards of ``newsletter`` from ``(start, end)`` primary key
+        ranges, unless another process already did. The shards of a send
+        window are not claimed by the workers before their ``start_dates``.
+        """
+        if self.filter(newsletter=newsletter).exists():
+            return False
+
+        start_dates = start_dates or [None] * len(ranges)
+
+        try:
+            with atomic():
+                self.bulk_create([self.model(newsletter=newsletter, start_pk=start, end_pk=end, leased_until=start_date)
+                                  for (start, end), start_date in zip(ranges, start_dates)])
+        except IntegrityError:
+            return False
+
+        return True
+
+    def claimable(self, newsletter, due=True):
+        now = datetime.now()
+
+        pending = Q(status=self.model.STATUS_PENDING)
+
+        if due:
+            pending &= Q(leased_until=None) | Q(leased_until__lte=now)
+
+        return self.filter(pending | Q(status=self.model.STATUS_RUNNING, leased_until__lt=now),
+                           newsletter=newsletter)
+
+    def waiting(self):
+        """
+        Returns the shards waiting for their start date in a send window.
+        """
+        return self.filter(status=self.model.STATUS_PENDING, leased_until__gt=datetime.now())
+
+    def claim(self, newsletter, worker, lease_timeout, start_pk=None):
+        """
+        Leases a pending shard, or a running one whose lease expired,
+        to ``worker`` and returns it. ``start_pk`` claims this shard only,
+        even before its start date.
+        """
+        shards = self.claimable(newsletter, due=start_pk is None)
+
+        if start_pk is not None:
+            shards = shards.filter(start_pk=start_pk)
+
+        for pk in shards.order_by('start_pk').values_list('pk', flat=True):
+            # Conditional update, the shard goes to a single worker
+            claimed = (shards
+                       .filter(pk=pk)
+                       .update(status=self.model.STATUS_RUNNING,
+                               worker=worker,
+                               leased_until=datetime.now() + datetime.timedelta(seconds=lease_timeout)))
+
+            if claimed:
+                return self.get(pk=pk)
+
+        return None
+
+
+class NewsletterSendShard(models.Model):
+    STATUS_PENDING = 1
+    STATUS_RUNNING = 2
+    STATUS_DONE = 3
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+    )
+
+    newsletter = models.ForeignKey(Newsletter, related_name='shards')
+    start_pk = models.PositiveIntegerField()
+    end_pk = models.PositiveIntegerField(null=True)
+    status = models.PositiveIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING)
+    worker = models.CharField(max_length=100, blank=True)
+    # End of the lease while running, start date in a send window while pending
+    leased_until = models.DateTimeField(null=True)
+    # Last subscriber delivered by the shard
+    checkpoint_pk = models.PositiveIntegerField(null=True)
+
+    objects = NewsletterSendShardManager()
+
+    class Meta:
+        unique_together = ('newsletter', 'start_pk')
+        index_together = [('newsletter', 'status', 'leased_until')]
+
+    def checkpoint(self, pk, lease_timeout):
+        """
+        Records that the subscribers up to ``pk`` were delivered and renews
+        the lease, returns ``False`` when the lease was stolen.
+        """
+        updated = (self.__class__.objects
+                   .filter(pk=self.pk, worker=self.worker, status=self.STATUS_RUNNING)
+                   .update(checkpoint_pk=pk,
+                           leased_until=datetime.now() + datetime.timedelta(seconds=lease_timeout)))
+
+        self.checkpoint_pk = pk
+
+        return bool(updated)
+
+    def renew(self, lease_timeout):
+        """
+        Renews the lease before a chunk is delivered, returns ``False``
+        when another worker took the shard over.
+        """
+        return bool(self.__class__.objects
+                    .filter(pk=self.pk, worker=self.worker, status=self.STATUS_RUNNING)
+                    .update(leased_until=datetime.now() + datetime.timedelta(seconds=lease_timeout)))
+
+    def finish(self):
+        self.status = self.STATUS_DONE
+
+        return bool(self.__class__.objects
+                    .filter(pk=self.pk, worker=self.worker, status=self.STATUS_RUNNING)
+                    .update(status=self.STATUS_DONE))
+
+    def release(self):
+        """
+        Gives the shard back after a failure, the next worker resumes
+        after its checkpoint.
+        """
+        self.status = self.STATUS_PENDING
+
+        return bool(self.__class__.objects
+                    .filter(pk=self.pk, worker=self.worker, status=self.STATUS_RUNNING)
+                    .update(status=self.STATUS_PENDING, leased_until=None))
+
+
+class BaseLanguage(models.Model):
+    # Targets every language, stored when ``languages`` is empty
+    ALL_LANGUAGES = ''
+
+    lang = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def sync(cls, instance, field_name, using=None):
+        """
+        Mirrors the ``languages`` field of ``instance`` in indexable rows,
+        the existing rows are read from the write database.
+        """
+        using = using or router.db_for_write(cls, instance=instance)
+
+        langs = instance.languages or []
+
+        if isinstance(langs, six.string_types):
+            langs = langs.split(instance._meta.get_field('languages').token)
+
+        langs = set(langs) or set([cls.ALL_LANGUAGES])
+
+        qs = cls.objects.db_manager(using).filter(**{field_name: instance})
+
+        existing = set(qs.values_list('lang', flat=True))
+
+        if existing - langs:
+            qs.filter(lang__in=existing - langs).delete()
+
+        if langs - existing:
+            cls.objects.db_manager(using).bulk_create([cls(lang=lang, **{field_name: instance})
+                                                        for lang in langs - existing])
+
+
+class NewsletterListLanguage(BaseLanguage):
+    newsletter_list = models.ForeignKey(NewsletterList, related_name='language_set')
+
+    class Meta:
+        unique_together = ('lang', 'newsletter_list')
+
+
+class NewsletterLanguage(BaseLanguage):
+    newsletter = models.ForeignKey(Newsletter, related_name='language_set')
+
+    class Meta:
+        unique_together = ('lang', 'newsletter')
+
+
 @python_2_unicode_compatible
 class NewsletterItem(models.Model):
     newsletter = models.ForeignKey(Newsletter, related_name="items")
@@ -169,29 +603,27 @@ class NewsletterItem(models.Model):
     def __str__(self):
         return self.name
 
+    def get_image_renditions(self):
+        return get_renditions(self.image)
+
 
 class NewsletterSubscriberQuerySet(QuerySet):
     def subscribed(self):
         return self.filter(is_unsubscribed=False)
 
+    def deliverable(self):
+        return self.subscribed().filter(is_bounced=False)
+
     def has_lang(self, lang):
         return self.filter(lang=lang)
 
     def has_langs(self, langs):
-        filter_q = None
-
-        for lang in langs:
-            if filter_q is None:
-                filter_q = models.Q(lang=lang)
-            else:
-                filter_q |= models.Q(lang=lang)
-
-        return self.filter(filter_q)
+        return self.filter(lang__in=langs)
 
 
 class NewsletterSubscriberManager(models.Manager):
     def get_queryset(self):
-        return NewsletterSubscriberQuerySet(self.model)
+        return NewsletterSubscriberQuerySet(self.model, using=self._db)
 
     if django.VERSION < (1, 6):
         get_query_set = get_queryset
@@ -199,6 +631,9 @@ class NewsletterSubscriberManager(models.Manager):
     def subscribed(self):
         return self.get_queryset().subscribed()
 
+    def deliverable(self):
+        return self.get_queryset().deliverable()
+
     def has_lang(self, lang):
         return self.get_queryset().has_lang(lang)
 
@@ -208,16 +643,28 @@ class NewsletterSubscriberManager(models.Manager):
 
 @python_2_unicode_compatible
 class NewsletterSubscriber(models.Model):
+    STATUS_SUBSCRIBED = 1
+    STATUS_UNSUBSCRIBED = 2
+
     subscribed_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(AUTH_USER_MODEL, blank=True, null=True)
     is_unsubscribed = models.BooleanField(default=False, db_index=True)
     unsubscribed_at = models.DateTimeField(blank=True, null=True)
+    # The address hard bounced, it is not mailed anymore
+    is_bounced = models.BooleanField(default=False)
     email = models.EmailField(max_length=250)
     lang = models.CharField(max_length=10, blank=True, null=True, choices=ALLOWED_LANGUAGES)
     newsletter_list = models.ForeignKey(NewsletterList, related_name='newsletter_subscribers')
 
     objects = NewsletterSubscriberManager()
 
+    class Meta:
+        # The backends store an empty language rather than NULL, which the
+        # constraint would not compare. Emails are stored as typed, the
+        # constraint is case-sensitive while the lookups are not.
+        unique_together = ('newsletter_list', 'email', 'lang')
+        index_together = [('newsletter_list', 'is_unsubscribed', 'lang')]
+
     def __str__(self):
         return '%s for %s' % (self.email, self.newsletter_list)
 
@@ -229,11 +676,386 @@ class NewsletterSubscriber(models.Model):
         self.is_unsubscribed = False
 
         if commit:
-            update_fields(self, fields=('is_unsubscribed', ))
+            self._transition(unsubscribed_at=self.unsubscribed_at)
 
     def unsubscribe(self, commit=True):
         self.is_unsubscribed = True
         self.unsubscribed_at = datetime.now()
 
         if commit:
-            update_fields(self, fields=('is_unsubscribed', 'unsubscribed_at', ))
+            self._transition(unsubscribed_at=self.unsubscribed_at)
+
+    def _transition(self, **values):
+        using = router.db_for_write(self.__class__, instance=self)
+
+        # Conditional update, the counters move once per actual change
+        changed = (self.__class__.objects.db_manager(using)
+                   .filter(pk=self.pk, is_unsubscribed=not self.is_unsubscribed)
+                   .update(is_unsubscribed=self.is_unsubscribed, **values))
+
+        if changed:
+            delta = -1 if self.is_unsubscribed else 1
+
+            NewsletterSubscriberCount.objects.adjust(self.newsletter_list_id, self.lang,
+                                                     subscribed=delta, unsubscribed=-delta,
+                                                     using=using)
+
+        if SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+            invalidate_subscriptions([self.email])
+
+
+class NewsletterSubscriberCountManager(Manager):
+    def adjust(self, newsletter_list_id, lang, subscribed=0, unsubscribed=0, using=None):
+        """
+        Adds ``subscribed`` and ``unsubscribed`` to the totals of
+        ``newsletter_list_id`` in ``lang``.
+        """
+        if not subscribed and not unsubscribed:
+            return
+
+        lang = lang or ''
+        using = using or router.db_for_write(self.model)
+
+        qs = self.db_manager(using).filter(newsletter_list=newsletter_list_id, lang=lang)
+
+        values = {
+            'subscribed': models.F('subscribed') + subscribed,
+            'unsubscribed': models.F('unsubscribed') + unsubscribed,
+        }
+
+        if qs.update(**values):
+            return
+
+        try:
+            with atomic(using=using):
+                self.db_manager(using).create(newsletter_list_id=newsletter_list_id, lang=lang,
+                                              subscribed=subscribed, unsubscribed=unsubscribed)
+        except IntegrityError:
+            # Created concurrently
+            qs.update(**values)
+
+    def totals(self, newsletter_list, langs=None):
+        """
+        Returns the ``(subscribed, unsubscribed)`` totals of ``newsletter_list``,
+        for ``langs`` only when given.
+        """
+        qs = self.filter(newsletter_list=newsletter_list)
+
+        if langs is not None:
+            qs = qs.filter(lang__in=[lang or '' for lang in langs])
+
+        totals = qs.aggregate(subscribed=models.Sum('subscribed'),
+                              unsubscribed=models.Sum('unsubscribed'))
+
+        return totals['subscribed'] or 0, totals['unsubscribed'] or 0
+
+    def rebuild(self):
+        """
+        Recomputes every counter from ``NewsletterSubscriber``.
+        """
+        counts = {}
+
+        for row in (NewsletterSubscriber.objects
+                    .values('newsletter_list', 'lang', 'is_unsubscribed')
+                    .annotate(count=models.Count('pk'))
+                    .order_by()):
+            count = counts.setdefault((row['newsletter_list'], row['lang'] or ''),
+                                      self.model(newsletter_list_id=row['newsletter_list'], lang=row['lang'] or ''))
+
+            if row['is_unsubscribed']:
+                count.unsubscribed += row['count']
+            else:
+                count.subscribed += row['count']
+
+        with atomic():
+            self.all().delete()
+            self.bulk_create(list(counts.values()))
+
+        return len(counts)
+
+
+class NewsletterSubscriberCount(models.Model):
+    newsletter_list = models.ForeignKey(NewsletterList, related_name='subscriber_counts')
+    # Empty for the subscribers without language
+    lang = models.CharField(max_length=10, blank=True)
+    subscribed = models.IntegerField(default=0)
+    unsubscribed = models.IntegerField(default=0)
+
+    objects = NewsletterSubscriberCountManager()
+
+    class Meta:
+        unique_together = ('newsletter_list', 'lang')
+
+
+class BatchManager(Manager):
+    """
+    Hands out the rows of a queue by batches, a row is processed by
+    a single task at once.
+    """
+    def claim(self, batch_size, lease_timeout=None):
+        """
+        Leases up to ``batch_size`` rows which are not leased by another task
+        and returns them, the rows of a task which died are claimed again
+        once their lease expired.
+        """
+        lease_timeout = lease_timeout or BATCH_LEASE_TIMEOUT
+
+        now = datetime.now()
+        worker = uuid.uuid4().hex
+
+        claimable = self.filter(Q(leased_until=None) | Q(leased_until__lt=now))
+
+        pks = list(claimable.order_by('pk').values_list('pk', flat=True)[:batch_size])
+
+        if not pks:
+            return self.none()
+
+        # Conditional update, the rows claimed meanwhile are skipped
+        (claimable
+         .filter(pk__in=pks)
+         .update(worker=worker, leased_until=now + datetime.timedelta(seconds=lease_timeout)))
+
+        return self.filter(worker=worker).order_by('pk')
+
+    def release(self, rows):
+        """
+        Gives back the claimed ``rows`` after a failure.
+        """
+        if rows:
+            (self.filter(pk__in=[row.pk for row in rows], worker=rows[0].worker)
+             .update(worker='', leased_until=None))
+
+
+class NewsletterSubscriptionRequestManager(BatchManager):
+    def subscribe(self, email, newsletter_list=None, lang=None, user=None):
+        return self.create(email=email,
+                           newsletter_list=newsletter_list,
+                           lang=lang,
+                           user=user,
+                           action=self.model.ACTION_SUBSCRIBE)
+
+    def unsubscribe(self, email, newsletter_list=None, lang=None, user=None):
+        return self.create(email=email,
+                           newsletter_list=newsletter_list,
+                           lang=lang,
+                           user=user,
+                           action=self.model.ACTION_UNSUBSCRIBE)
+
+    def coalesce(self, requests):
+        """
+        Collapses ``requests`` to the last action per subscription and groups
+        them in batches of ``(action, newsletter_list, lang, {email: user_id})``
+        returned in the order they have to be applied.
+        """
+        latest = {}
+
+        for request in requests:
+            subscriptions = latest.setdefault(request.email.lower(), {})
+
+            if request.newsletter_list_id is None:
+                # Unsubscribing from all lists supersedes every previous request
+                subscriptions.clear()
+            elif not request.lang:
+                # A request without language applies to every language of the list
+                for key in [key for key in subscriptions if key[0] == request.newsletter_list_id]:
+                    del subscriptions[key]
+
+            subscriptions[(request.newsletter_list_id, request.lang or None)] = request
+
+        batches = {}
+
+        for subscriptions in latest.values():
+            for (newsletter_list_id, lang), request in subscriptions.items():
+                if newsletter_list_id is None:
+                    phase = 0
+                elif lang is None:
+                    phase = 1
+                else:
+                    phase = 2
+
+                newsletter_list, emails = batches.setdefault((phase, request.action, newsletter_list_id, lang),
+                                                             (request.newsletter_list, {}))
+                emails[request.email] = request.user_id
+
+        return [(action, newsletter_list, lang, emails)
+                for (phase, action, newsletter_list_id, lang), (newsletter_list, emails)
+                in sorted(batches.items(), key=lambda batch: batch[0][0])]
+
+
+@python_2_unicode_compatible
+class NewsletterSubscriptionRequest(models.Model):
+    ACTION_SUBSCRIBE = 1
+    ACTION_UNSUBSCRIBE = 2
+
+    ACTION_CHOICES = (
+        (ACTION_SUBSCRIBE, _('Subscribe')),
+        (ACTION_UNSUBSCRIBE, _('Unsubscribe')),
+    )
+
+    action = models.PositiveIntegerField(choices=ACTION_CHOICES)
+    email = models.EmailField(max_length=250)
+    lang = models.CharField(max_length=10, blank=True, null=True, choices=ALLOWED_LANGUAGES)
+    newsletter_list = models.ForeignKey(NewsletterList, blank=True, null=True,
+                                        related_name='subscription_requests')
+    user = models.ForeignKey(AUTH_USER_MODEL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Task processing the request until the end of its lease
+    worker = models.CharField(max_length=32, blank=True)
+    leased_until = models.DateTimeField(null=True, db_index=True)
+
+    objects = NewsletterSubscriptionRequestManager()
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return '%s %s' % (self.get_action_display(), self.email)
+
+    def is_subscribe(self):
+        return self.action == self.ACTION_SUBSCRIBE
+
+
+class NewsletterEvent(models.Model):
+    SOURCE_MAILJET = 'mailjet'
+    SOURCE_MAILCHIMP = 'mailchimp'
+    SOURCE_GENERIC = 'generic'
+
+    SOURCE_CHOICES = (
+        (SOURCE_MAILJET, 'Mailjet'),
+        (SOURCE_MAILCHIMP, 'Mailchimp'),
+        (SOURCE_GENERIC, _('Generic')),
+    )
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    # Raw request body, parsed when the event is processed
+    payload = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Task processing the event until the end of its lease
+    worker = models.CharField(max_length=32, blank=True)
+    leased_until = models.DateTimeField(null=True, db_index=True)
+
+    objects = BatchManager()
+
+    class Meta:
+        ordering = ['pk']
+
+
+@receiver(post_save, sender=NewsletterSubscriber)
+@receiver(post_delete, sender=NewsletterSubscriber)
+def invalidate_subscription_status(sender, instance, **kwargs):
+    if SUBSCRIPTION_STATUS_CACHE_TIMEOUT:
+        invalidate_subscriptions([instance.email])
+
+
+@receiver(post_save, sender=NewsletterSubscriber)
+def count_created_subscriber(sender, instance, created, **kwargs):
+    if created:
+        NewsletterSubscriberCount.objects.adjust(instance.newsletter_list_id, instance.lang,
+                                                 subscribed=int(not instance.is_unsubscribed),
+                                                 unsubscribed=int(instance.is_unsubscribed),
+                                                 using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=NewsletterSubscriber)
+def count_deleted_subscriber(sender, instance, **kwargs):
+    NewsletterSubscriberCount.objects.adjust(instance.newsletter_list_id, instance.lang,
+                                             subscribed=-int(not instance.is_unsubscribed),
+                                             unsubscribed=-int(instance.is_unsubscribed),
+                                             using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=NewsletterList)
+@receiver(post_delete, sender=NewsletterList)
+def invalidate_newsletter_list_archive(sender, instance, **kwargs):
+    if ARCHIVE_CACHE_TIMEOUT:
+        invalidate_archive()
+
+
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Newsletter)
+def invalidate_newsletter_archive(sender, instance, **kwargs):
+    if ARCHIVE_CACHE_TIMEOUT:
+        slugs = (NewsletterList.objects.db_manager(kwargs.get('using'))
+                 .filter(pk=instance.newsletter_list_id)
+                 .values_list('slug', flat=True))
+
+        invalidate_archive(slugs[0] if slugs else None)
+
+
+@receiver(post_save, sender=NewsletterItem)
+@receiver(post_delete, sender=NewsletterItem)
+def invalidate_newsletter_item_archive(sender, instance, **kwargs):
+    if ARCHIVE_CACHE_TIMEOUT:
+        slugs = (Newsletter.objects.db_manager(kwargs.get('using'))
+                 .filter(pk=instance.newsletter_id)
+                 .values_list('newsletter_list__slug', flat=True))
+
+        invalidate_archive(slugs[0] if slugs else None)
+
+
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Newsletter)
+def relink_newsletters(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+
+    if update_fields and not set(update_fields) & set(['status', 'published_at', 'newsletter_list']):
+        return
+
+    # Lists the newsletter has been moved from still point to it
+    newsletter_list_ids = set(Newsletter.objects.db_manager(kwargs.get('using'))
+                              .filter(Q(previous_newsletter=instance.pk) | Q(next_newsletter=instance.pk))
+                              .values_list('newsletter_list', flat=True))
+    newsletter_list_ids.add(instance.newsletter_list_id)
+
+    for newsletter_list_id in newsletter_list_ids:
+        Newsletter.objects.relink(newsletter_list_id, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=NewsletterList)
+def sync_newsletter_list_languages(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+
+    if not update_fields or 'languages' in update_fields:
+        NewsletterListLanguage.sync(instance, 'newsletter_list', using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Newsletter)
+def sync_newsletter_languages(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+
+    if not update_fields or 'languages' in update_fields:
+        NewsletterLanguage.sync(instance, 'newsletter', using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Newsletter)
+def invalidate_newsletter_snapshots(sender, instance, created, **kwargs):
+    update_fields = kwargs.get('update_fields')
+
+    if not created and (not update_fields or set(update_fields) - set(Newsletter.STATE_FIELDS)):
+        NewsletterSnapshot.objects.filter(newsletter=instance).delete()
+
+
+@receiver(post_save, sender=NewsletterItem)
+@receiver(post_delete, sender=NewsletterItem)
+def invalidate_newsletter_item_snapshots(sender, instance, **kwargs):
+    NewsletterSnapshot.objects.filter(newsletter=instance.newsletter_id).delete()
+
+
+@receiver(post_save, sender=NewsletterItem)
+@receiver(post_delete, sender=NewsletterItem)
+def touch_newsletter(sender, instance, **kwargs):
+    Newsletter.objects.filter(pk=instance.newsletter_id).update(updated_at=datetime.now())
+
+
+@receiver(post_save, sender=Newsletter)
+@receiver(post_save, sender=NewsletterItem)
+def generate_image_renditions(sender, instance, **kwargs):
+    if not RENDITIONS:
+        return
+
+    field_file = instance.cover if sender is Newsletter else instance.image
+
+    if field_file and len(get_renditions(field_file)) < len(RENDITIONS):
+        from .tasks import generate_renditions
+
+        generate_renditions.delay(field_file.name)
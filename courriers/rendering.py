@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import collections
+import multiprocessing
+import time
+
+from django.template.loader import render_to_string
+from django.utils import translation
+
+from .settings import PRE_PROCESSORS
+from .utils import load_class
+
+
+def render_newsletter(newsletter, extra_context=None):
+    """
+    Renders the HTML and text versions of ``newsletter`` in the active
+    language, the HTML version goes through ``PRE_PROCESSORS``.
+    """
+    context = {
+        'object': newsletter,
+        'items': newsletter.get_items()
+    }
+
+    context.update(extra_context or {})
+
+    html = render_to_string('courriers/newsletter_raw_detail.html', context)
+
+    for pre_processor in PRE_PROCESSORS:
+        html = load_class(pre_processor)(html)
+
+    text = render_to_string('courriers/newsletter_raw_detail.txt', context)
+
+    return html, text
+
+
+# State of a render worker, set once by init_render_worker
+_worker = {}
+
+# Database connections inherited from the parent process
+_inherited_connections = []
+
+
+def init_render_worker(backend, newsletter):
+    from django.db import connections
+
+    for connection in connections.all():
+        # Closing a socket shared with the parent would close its connection
+        # too, it is kept open and the worker connects again when needed.
+        # SQLite connections have no socket and in-memory databases only
+        # exist in the inherited connection.
+        if connection.vendor != 'sqlite' and connection.connection is not None:
+            _inherited_connections.append(connection.connection)
+            connection.connection = None
+
+    _worker['backend'] = backend
+    _worker['newsletter'] = newsletter
+
+
+def render_message(subscriber):
+    start = time.time()
+
+    translation.activate(_worker['backend'].get_language(_worker['newsletter'], subscriber))
+
+    html, text = render_newsletter(_worker['newsletter'], {'subscriber': subscriber})
+
+    email = _worker['backend'].build_message(_worker['newsletter'], subscriber, html, text).prepare()
+
+    return email, time.time() - start
+
+
+def render_messages(backend, newsletter, subscribers, processes, queue_size):
+    """
+    Renders the messages of ``subscribers`` in ``processes`` forked workers
+    and yields them in order with their render time, no more than
+    ``queue_size`` messages are waiting for the consumer at once.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        # The workers inherit the loaded apps and the newsletter items
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing
+
+    pool = context.Pool(processes, initializer=init_render_worker, initargs=(backend, newsletter))
+
+    pending = collections.deque()
+
+    try:
+        for subscriber in subscribers:
+            pending.append(pool.apply_async(render_message, (subscriber, )))
+
+            if len(pending) >= queue_size:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
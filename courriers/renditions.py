@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.encoding import force_bytes
+from django.utils.six import BytesIO
+
+from .cache import cache, make_key
+from .settings import RENDITIONS, RENDITIONS_CACHE_TIMEOUT
+
+
+class Renditions(dict):
+    """
+    Maps rendition names to URLs, falling back to the original URL
+    for renditions which are not generated yet.
+    """
+    def __init__(self, url, *args, **kwargs):
+        super(Renditions, self).__init__(*args, **kwargs)
+
+        self.url = url
+
+    def __missing__(self, key):
+        return self.url
+
+
+def rendition_name(name, rendition):
+    root, ext = os.path.splitext(name)
+
+    return '%s.%s%s' % (root, rendition, ext)
+
+
+def renditions_key(name):
+    return make_key('renditions', hashlib.md5(force_bytes(name)).hexdigest())
+
+
+def get_renditions(field_file):
+    """
+    Returns the ``Renditions`` of ``field_file``, the mapping is read
+    from the storage only when it is not cached.
+    """
+    if not field_file:
+        return Renditions('')
+
+    storage = field_file.storage
+    key = renditions_key(field_file.name)
+
+    urls = cache().get(key)
+
+    if urls is None:
+        urls = {}
+
+        for rendition in RENDITIONS:
+            name = rendition_name(field_file.name, rendition)
+
+            if storage.exists(name):
+                urls[rendition] = storage.url(name)
+
+        cache().set(key, urls, RENDITIONS_CACHE_TIMEOUT)
+
+    return Renditions(field_file.url, urls)
+
+
+def generate_renditions(name, storage=None):
+    """
+    Resizes and recompresses the image ``name`` for each of ``RENDITIONS``,
+    existing renditions are replaced.
+    """
+    from PIL import Image
+
+    storage = storage or default_storage
+
+    with storage.open(name) as f:
+        original = Image.open(f)
+        original.load()
+
+    format = original.format or 'JPEG'
+
+    urls = {}
+
+    for rendition, (width, quality) in RENDITIONS.items():
+        image = original.copy()
+
+        if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        if image.size[0] > width:
+            image.thumbnail((width, image.size[1]), Image.ANTIALIAS)
+
+        content = BytesIO()
+        image.save(content, format, quality=quality, optimize=True)
+
+        path = rendition_name(name, rendition)
+
+        if storage.exists(path):
+            storage.delete(path)
+
+        urls[rendition] = storage.url(storage.save(path, ContentFile(content.getvalue())))
+
+    cache().set(renditions_key(name), urls, RENDITIONS_CACHE_TIMEOUT)
+
+    return urls
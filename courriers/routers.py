@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import random
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .settings import DATABASE_REPLICAS
+
+
+class ReplicaRouter(object):
+    """
+    Reads the newsletters and the subscribers from one of
+    ``COURRIERS_DATABASE_REPLICAS`` and writes them to the default database.
+
+    The queues and the send coordination tables are always read from the
+    default database, they are written and read back immediately.
+    """
+    app_label = 'courriers'
+
+    replica_models = (
+        'newsletterlist',
+        'newsletterlistlanguage',
+        'newsletter',
+        'newsletterlanguage',
+        'newsletteritem',
+        'newslettersnapshot',
+        'newslettersubscriber',
+        'newslettersubscribercount',
+    )
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+
+        if DATABASE_REPLICAS and model._meta.object_name.lower() in self.replica_models:
+            return random.choice(DATABASE_REPLICAS)
+
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set((DEFAULT_DB_ALIAS, ) + tuple(DATABASE_REPLICAS))
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
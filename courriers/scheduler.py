@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import time
+import uuid
+
+from django.utils import timezone as datetime
+
+from .exceptions import DuplicateSendError
+from .models import Newsletter, NewsletterSendShard
+from .settings import SEND_BATCH_SIZE, SEND_CHECKPOINT_SIZE, SEND_LEASE_TIMEOUT, SEND_WINDOW
+
+
+def get_send_ranges(backend, newsletter, batch_size=None, using=None):
+    """
+    Splits the subscribers of ``newsletter`` in ``(start, end)`` primary key
+    ranges of ``batch_size`` subscribers, ``end`` is excluded and ``None``
+    for the last range.
+    """
+    if not getattr(backend, 'batched_sends', False):
+        return [None]
+
+    batch_size = batch_size or SEND_BATCH_SIZE
+
+    pks = backend.get_subscribers(newsletter, using=using).order_by('pk').values_list('pk', flat=True)
+
+    start = None
+    ranges = []
+
+    while True:
+        qs = pks if start is None else pks.filter(pk__gte=start)
+
+        end = list(qs[batch_size:batch_size + 1])
+
+        if not end:
+            ranges.append((start or 0, None))
+
+            return ranges
+
+        ranges.append((start or 0, end[0]))
+
+        start = end[0]
+
+
+def claim_newsletter(newsletter):
+    """
+    Returns ``True`` when the current process won the right to send
+    the scheduled ``newsletter``.
+    """
+    return bool(Newsletter.objects
+                .filter(pk=newsletter.pk, scheduled=True, sent=False)
+                .update(scheduled=False))
+
+
+def renew_waiting_sends():
+    """
+    Renews the heartbeat of the sends whose batches wait for their start
+    date in a send window, no worker beats for them meanwhile.
+    """
+    return (Newsletter.objects
+            .filter(pk__in=NewsletterSendShard.objects.waiting().values('newsletter'),
+                    send_status=Newsletter.SEND_STATUS_SENDING)
+            .update(send_heartbeat_at=datetime.now()))
+
+
+def dispatch_due_newsletters(now=None, window=None):
+    """
+    Claims the scheduled newsletters published before ``now`` and enqueues
+    their sends, spreading the batches of each one over ``window`` seconds.
+    """
+    from .backends import get_backend
+    from .tasks import send_newsletter
+
+    now = now or datetime.now()
+    window = SEND_WINDOW if window is None else window
+
+    renew_waiting_sends()
+
+    backend = get_backend()()
+
+    newsletters = (Newsletter.objects
+                   .filter(status=Newsletter.STATUS_ONLINE, scheduled=True, sent=False, published_at__lte=now)
+                   .order_by('published_at'))
+
+    dispatched = []
+
+    for newsletter in newsletters:
+        if not claim_newsletter(newsletter):
+            continue
+
+        ranges = get_send_ranges(backend, newsletter)
+
+        countdowns = [window * i // len(ranges) for i in range(len(ranges))]
+
+        # Unbatched sends are claimed by the backend itself
+        if ranges != [None]:
+            if not newsletter.claim_send():
+                continue
+
+            start_dates = [datetime.now() + datetime.timedelta(seconds=countdown) for countdown in countdowns]
+
+            # Each batch is a shard, the send finishes once they are all done
+            if not NewsletterSendShard.objects.prepare(newsletter, ranges, start_dates):
+                # Resumes the batches left by a previous send
+                ranges = list(NewsletterSendShard.objects
+                              .filter(newsletter=newsletter)
+                              .exclude(status=NewsletterSendShard.STATUS_DONE)
+                              .order_by('start_pk')
+                              .values_list('start_pk', 'end_pk'))
+
+                countdowns = [window * i // len(ranges) for i in range(len(ranges))]
+
+        for pk_range, countdown in zip(ranges, countdowns):
+            send_newsletter.apply_async(args=(newsletter.pk, ),
+                                        kwargs={'pk_range': pk_range},
+                                        countdown=countdown)
+
+        dispatched.append(newsletter)
+
+    return dispatched
+
+
+def get_worker_id():
+    return '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def send_shards(backend, newsletter, worker=None, lease_timeout=None, checkpoint_size=None, using=None):
+    """
+    Delivers the shards of ``newsletter`` until none can be claimed, several
+    workers can run it at once. Returns the number of delivered subscribers,
+    read from the ``using`` database when given.
+    """
+    if not getattr(backend, 'batched_sends', False):
+        raise ValueError('%s cannot send a newsletter in shards' % backend.__class__.__name__)
+
+    worker = worker or get_worker_id()
+    lease_timeout = lease_timeout or SEND_LEASE_TIMEOUT
+    checkpoint_size = checkpoint_size or SEND_CHECKPOINT_SIZE
+
+    # The first worker, or the one resuming a stalled send, creates the
+    # shards. The others join while the send is running.
+    if newsletter.claim_send():
+        NewsletterSendShard.objects.prepare(newsletter, get_send_ranges(backend, newsletter, using=using))
+    elif not wait_for_shards(newsletter, lease_timeout):
+        raise DuplicateSendError('The newsletter "%s" is being sent or was already sent.' % newsletter)
+
+    count = deliver_shards(backend, newsletter, worker, lease_timeout, checkpoint_size, using=using)
+
+    finish_shards(newsletter)
+
+    return count
+
+
+def deliver_shards(backend, newsletter, worker=None, lease_timeout=None, checkpoint_size=None, using=None,
+                   fail_silently=False):
+    """
+    Delivers the shards of a claimed send until none can be claimed.
+    """
+    worker = worker or get_worker_id()
+    lease_timeout = lease_timeout or SEND_LEASE_TIMEOUT
+    checkpoint_size = checkpoint_size or SEND_CHECKPOINT_SIZE
+
+    count = 0
+
+    while True:
+        shard = NewsletterSendShard.objects.claim(newsletter, worker, lease_timeout)
+
+        if shard is None:
+            return count
+
+        count += send_shard(backend, newsletter, shard, lease_timeout, checkpoint_size, using=using,
+                            fail_silently=fail_silently)
+
+
+def wait_for_shards(newsletter, timeout, interval=1):
+    """
+    Waits up to ``timeout`` seconds for the worker which claimed the send
+    of ``newsletter`` to create its shards. Returns ``False`` when the
+    newsletter is not being sent.
+    """
+    deadline = time.time() + timeout
+
+    while True:
+        # Read again, the newsletter may have been loaded before the claim
+        if not Newsletter.objects.filter(pk=newsletter.pk, send_status=Newsletter.SEND_STATUS_SENDING).exists():
+            return False
+
+        if NewsletterSendShard.objects.filter(newsletter=newsletter).exists():
+            return True
+
+        if time.time() >= deadline:
+            return False
+
+        time.sleep(interval)
+
+
+def send_batch(backend, newsletter, pk_range, worker=None, lease_timeout=None, checkpoint_size=None, using=None):
+    """
+    Delivers the batch of a scheduled send starting at ``pk_range``, unless
+    a shard worker took it. The send finishes with its last batch.
+    """
+    worker = worker or get_worker_id()
+    lease_timeout = lease_timeout or SEND_LEASE_TIMEOUT
+    checkpoint_size = checkpoint_size or SEND_CHECKPOINT_SIZE
+
+    shard = NewsletterSendShard.objects.claim(newsletter, worker, lease_timeout, start_pk=pk_range[0])
+
+    if shard is None:
+        return 0
+
+    count = send_shard(backend, newsletter, shard, lease_timeout, checkpoint_size, using=using)
+
+    finish_shards(newsletter)
+
+    return count
+
+
+def finish_shards(newsletter):
+    if not NewsletterSendShard.objects.filter(newsletter=newsletter).exclude(status=NewsletterSendShard.STATUS_DONE).exists():
+        newsletter.finish_send()
+
+
+def send_shard(backend, newsletter, shard, lease_timeout, checkpoint_size, using=None, fail_silently=False):
+    pks = backend.get_subscribers(newsletter, using=using).order_by('pk').values_list('pk', flat=True)
+
+    if shard.end_pk is not None:
+        pks = pks.filter(pk__lt=shard.end_pk)
+
+    count = 0
+
+    while True:
+        # Resumes after the checkpoint of a worker which lost the lease
+        if shard.checkpoint_pk is None:
+            chunk = list(pks.filter(pk__gte=shard.start_pk)[:checkpoint_size])
+        else:
+            chunk = list(pks.filter(pk__gt=shard.checkpoint_pk)[:checkpoint_size])
+
+        if not chunk:
+            shard.finish()
+
+            return count
+
+        # The whole lease is left to deliver the chunk
+        if not shard.renew(lease_timeout):
+            # Stolen by another worker
+            return count
+
+        try:
+            backend.send_mails(newsletter, fail_silently=fail_silently, pk_range=(chunk[0], chunk[-1] + 1),
+                               using=using)
+        except Exception:
+            # Resumed after the checkpoint by the next worker
+            shard.release()
+            raise
+
+        count += len(chunk)
+
+        if not shard.checkpoint(chunk[-1], lease_timeout):
+            # Stolen by another worker
+            return count
@@ -17,6 +17,110 @@ ALLOWED_LANGUAGES = getattr(settings, 'COURRIERS_ALLOWED_LANGUAGES', settings.LA
 
 PRE_PROCESSORS = getattr(settings, 'COURRIERS_PRE_PROCESSORS', ())
 
+RENDER_PER_SUBSCRIBER = getattr(settings, 'COURRIERS_RENDER_PER_SUBSCRIBER', False)
+
+# Maps a rendition name to its (max width, quality)
+RENDITIONS = getattr(settings, 'COURRIERS_RENDITIONS', {})
+
+RENDITIONS_CACHE_TIMEOUT = getattr(settings, 'COURRIERS_RENDITIONS_CACHE_TIMEOUT', 86400)
+
 PAGINATE_BY = getattr(settings, 'COURRIERS_PAGINATE_BY', 9)
 
+CURSOR_PAGINATION = getattr(settings, 'COURRIERS_CURSOR_PAGINATION', False)
+
 FAIL_SILENTLY = getattr(settings, 'COURRIERS_FAIL_SILENTLY', False)
+
+SEND_BATCH_SIZE = getattr(settings, 'COURRIERS_SEND_BATCH_SIZE', 1000)
+
+# Seconds over which the batches of a scheduled send are spread
+SEND_WINDOW = getattr(settings, 'COURRIERS_SEND_WINDOW', 0)
+
+SEND_HEARTBEAT_TIMEOUT = getattr(settings, 'COURRIERS_SEND_HEARTBEAT_TIMEOUT', 600)
+
+SEND_LEASE_TIMEOUT = getattr(settings, 'COURRIERS_SEND_LEASE_TIMEOUT', 300)
+
+SEND_CHECKPOINT_SIZE = getattr(settings, 'COURRIERS_SEND_CHECKPOINT_SIZE', 100)
+
+COALESCE_SUBSCRIPTIONS = getattr(settings, 'COURRIERS_COALESCE_SUBSCRIPTIONS', False)
+
+COALESCE_BATCH_SIZE = getattr(settings, 'COURRIERS_COALESCE_BATCH_SIZE', 500)
+
+# Seconds after which the batch of a task which died is processed again
+BATCH_LEASE_TIMEOUT = getattr(settings, 'COURRIERS_BATCH_LEASE_TIMEOUT', 600)
+
+CACHE_ALIAS = getattr(settings, 'COURRIERS_CACHE_ALIAS', 'default')
+
+SUBSCRIPTION_STATUS_CACHE_TIMEOUT = getattr(settings, 'COURRIERS_SUBSCRIPTION_STATUS_CACHE_TIMEOUT', 0)
+
+IDEMPOTENCY_TIMEOUT = getattr(settings, 'COURRIERS_IDEMPOTENCY_TIMEOUT', 300)
+
+ARCHIVE_CACHE_TIMEOUT = getattr(settings, 'COURRIERS_ARCHIVE_CACHE_TIMEOUT', 0)
+
+HTTP_CACHE_MAX_AGE = getattr(settings, 'COURRIERS_HTTP_CACHE_MAX_AGE', 0)
+
+# Expected in the ``token`` parameter of the webhook URLs, the webhooks are
+# disabled without it
+WEBHOOK_TOKEN = getattr(settings, 'COURRIERS_WEBHOOK_TOKEN', None)
+
+EVENTS_BATCH_SIZE = getattr(settings, 'COURRIERS_EVENTS_BATCH_SIZE', 500)
+
+# Database aliases the ReplicaRouter reads from
+DATABASE_REPLICAS = getattr(settings, 'COURRIERS_DATABASE_REPLICAS', ())
+
+# Absolute URL of the site, used to build the one-click unsubscribe links
+SITE_URL = getattr(settings, 'COURRIERS_SITE_URL', None)
+
+METRICS_ENABLED = getattr(settings, 'COURRIERS_METRICS_ENABLED', True)
+
+# Upper bounds in seconds of the latency histograms
+METRICS_BUCKETS = getattr(settings, 'COURRIERS_METRICS_BUCKETS',
+                          (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+# Dotted paths of the classes which receive every metric, e.g. courriers.metrics.StatsdSink
+METRICS_SINKS = getattr(settings, 'COURRIERS_METRICS_SINKS', ())
+
+METRICS_TOKEN = getattr(settings, 'COURRIERS_METRICS_TOKEN', None)
+
+STATSD_HOST = getattr(settings, 'COURRIERS_STATSD_HOST', 'localhost')
+
+STATSD_PORT = getattr(settings, 'COURRIERS_STATSD_PORT', 8125)
+
+STATSD_PREFIX = getattr(settings, 'COURRIERS_STATSD_PREFIX', 'courriers')
+
+# Provider calls slower than this number of seconds are logged
+PROVIDER_SLOW_CALL_THRESHOLD = getattr(settings, 'COURRIERS_PROVIDER_SLOW_CALL_THRESHOLD', 1.0)
+
+# Processes rendering the mails when RENDER_PER_SUBSCRIBER is set, 0 renders them in the sending process
+RENDER_PROCESSES = getattr(settings, 'COURRIERS_RENDER_PROCESSES', 0)
+
+# Maximum number of mails being rendered ahead of the sending
+RENDER_QUEUE_SIZE = getattr(settings, 'COURRIERS_RENDER_QUEUE_SIZE', 1000)
+
+# Email backend of the newsletters, e.g. courriers.spool.SpoolEmailBackend, defaults to EMAIL_BACKEND
+EMAIL_BACKEND = getattr(settings, 'COURRIERS_EMAIL_BACKEND', None)
+
+SPOOL_DIR = getattr(settings, 'COURRIERS_SPOOL_DIR', None)
+
+SPOOL_FSYNC = getattr(settings, 'COURRIERS_SPOOL_FSYNC', True)
+
+# Email backend which relays the spooled messages
+SPOOL_RELAY_BACKEND = getattr(settings, 'COURRIERS_SPOOL_RELAY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+
+SPOOL_CONNECTIONS = getattr(settings, 'COURRIERS_SPOOL_CONNECTIONS', 4)
+
+# Messages claimed at once by a drainer, relayed before the next ones are claimed
+SPOOL_BATCH_SIZE = getattr(settings, 'COURRIERS_SPOOL_BATCH_SIZE', 100)
+
+# Seconds after which the messages claimed by a dead drainer are relayed again
+SPOOL_STALE_TIMEOUT = getattr(settings, 'COURRIERS_SPOOL_STALE_TIMEOUT', 600)
+
+# DKIM signing of the newsletters, requires dkimpy, the private key is a PEM string
+DKIM_PRIVATE_KEY = getattr(settings, 'COURRIERS_DKIM_PRIVATE_KEY', None)
+
+DKIM_DOMAIN = getattr(settings, 'COURRIERS_DKIM_DOMAIN', None)
+
+DKIM_SELECTOR = getattr(settings, 'COURRIERS_DKIM_SELECTOR', None)
+
+DKIM_HEADERS = getattr(settings, 'COURRIERS_DKIM_HEADERS', ('From', 'To', 'Subject', 'Date', 'Message-ID',
+                                                            'MIME-Version', 'Content-Type',
+                                                            'List-Unsubscribe', 'List-Unsubscribe-Post'))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import base64
+import hashlib
+import threading
+import time
+
+import six
+
+from django.utils.encoding import force_bytes, force_text
+
+from .compat import get_arg_names
+from .settings import DKIM_DOMAIN, DKIM_HEADERS, DKIM_PRIVATE_KEY, DKIM_SELECTOR
+
+# Parsed private keys by PEM content
+_private_keys = {}
+
+_signers = {}
+
+_lock = threading.Lock()
+
+
+def load_private_key(pem):
+    """
+    Parses the PEM ``pem`` RSA private key once per process.
+    """
+    from dkim.crypto import parse_pem_private_key
+
+    pem = force_bytes(pem)
+
+    if pem not in _private_keys:
+        _private_keys[pem] = parse_pem_private_key(pem)
+
+    return _private_keys[pem]
+
+
+def mime_bytes(mime, encoding='utf-8'):
+    """
+    Returns the CRLF separated content of ``mime``, as sent over SMTP.
+    """
+    as_bytes = getattr(mime, 'as_bytes', None)
+
+    # The messages of Django < 1.7 do not accept linesep
+    if as_bytes is not None and 'linesep' in get_arg_names(as_bytes):
+        content = as_bytes(linesep='\r\n')
+    else:
+        content = force_bytes(mime.as_string(), encoding)
+
+    # The Python 2 generator ignores linesep
+    return content.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+
+def set_boundaries(mime, variant):
+    """
+    Replaces the random multipart boundaries of ``mime`` so that the
+    messages of ``variant`` have the same body.
+    """
+    boundary = '===============%s' % hashlib.sha1(force_bytes(variant)).hexdigest()
+
+    for i, part in enumerate(mime.walk()):
+        if part.is_multipart():
+            part.set_boundary('%s_%d==' % (boundary, i))
+
+
+class DKIMSigner(object):
+    """
+    Signs messages with relaxed/relaxed DKIM signatures. The body hash of
+    the messages sharing a ``variant`` is computed once, only their headers
+    are hashed and signed for each message.
+    """
+    max_variants = 100
+
+    def __init__(self, domain, selector, private_key, headers=None):
+        from dkim.canonicalization import CanonicalizationPolicy
+
+        self.domain = force_bytes(domain)
+        self.selector = force_bytes(selector)
+        self.key = load_private_key(private_key)
+        self.headers = tuple(force_bytes(header).lower() for header in (headers or DKIM_HEADERS))
+        self.policy = CanonicalizationPolicy.from_c_value(b'relaxed/relaxed')
+        self.body_hashes = {}
+
+    def body_hash(self, body, variant=None):
+        if variant is not None and variant in self.body_hashes:
+            return self.body_hashes[variant]
+
+        body_hash = base64.b64encode(hashlib.sha256(self.policy.canonicalize_body(body)).digest())
+
+        if variant is not None:
+            if len(self.body_hashes) >= self.max_variants:
+                self.body_hashes.clear()
+
+            self.body_hashes[variant] = body_hash
+
+        return body_hash
+
+    def sign(self, content, variant=None):
+        """
+        Returns the ``DKIM-Signature`` header line of the CRLF separated
+        message ``content``.
+        """
+        import dkim
+
+        from dkim.crypto import RSASSA_PKCS1_v1_5_sign
+
+        headers, body = dkim.rfc822_parse(content)
+
+        fields = [
+            (b'v', b'1'),
+            (b'a', b'rsa-sha256'),
+            (b'c', self.policy.to_c_value()),
+            (b'd', self.domain),
+            (b's', self.selector),
+            (b't', force_bytes(int(time.time()))),
+            (b'h', b' : '.join(self.headers)),
+            (b'bh', self.body_hash(body, variant)),
+            # Folded on its own line like dkimpy, the other tags keep
+            # their folding once the signature is set
+            (b'b', b'0' * 60),
+        ]
+
+        value = dkim.fold(b'; '.join(b'='.join(field) for field in fields), namelen=len(b'DKIM-Signature'))
+        value = dkim.RE_BTAG.sub(b'\\1', value)
+
+        hasher = hashlib.sha256()
+
+        dkim.hash_headers(hasher, self.policy, self.policy.canonicalize_headers(headers), self.headers,
+                          (b'DKIM-Signature', b' ' + value), dict(fields))
+
+        fields[-1] = (b'b', base64.b64encode(bytes(RSASSA_PKCS1_v1_5_sign(hasher, self.key))))
+
+        value = dkim.fold(b'; '.join(b'='.join(field) for field in fields) + b'\r\n',
+                          namelen=len(b'DKIM-Signature'))
+
+        return b'DKIM-Signature: ' + value
+
+
+def get_signer():
+    """
+    Returns the signer of the DKIM settings, ``None`` when signing
+    is disabled.
+    """
+    if not (DKIM_DOMAIN and DKIM_SELECTOR and DKIM_PRIVATE_KEY):
+        return None
+
+    key = (DKIM_DOMAIN, DKIM_SELECTOR, DKIM_PRIVATE_KEY)
+
+    with _lock:
+        if key not in _signers:
+            _signers[key] = DKIMSigner(DKIM_DOMAIN, DKIM_SELECTOR, DKIM_PRIVATE_KEY)
+
+        return _signers[key]
+
+
+class SignedMessage(object):
+    """
+    A MIME message serialized once with its DKIM signature, the email
+    backends send these exact bytes.
+    """
+    def __init__(self, mime, content):
+        self.mime = mime
+        self.content = content
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        return self.content
+
+    def as_string(self, unixfrom=False, linesep='\n'):
+        return self.content if six.PY2 else force_text(self.content, errors='replace')
+
+    def __getattr__(self, name):
+        if name == 'mime':
+            # Not set yet while unpickling
+            raise AttributeError(name)
+
+        return getattr(self.mime, name)
+
+    def __getitem__(self, name):
+        return self.mime[name]
+
+    def __contains__(self, name):
+        return name in self.mime
+
+
+def sign_message(mime, variant=None, signer=None):
+    signer = signer or get_signer()
+
+    content = mime_bytes(mime)
+
+    return SignedMessage(mime, signer.sign(content, variant) + content)
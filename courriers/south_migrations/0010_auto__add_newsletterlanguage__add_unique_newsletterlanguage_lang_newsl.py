@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'NewsletterLanguage'
+        db.create_table(u'courriers_newsletterlanguage', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('lang', self.gf('django.db.models.fields.CharField')(max_length=10, blank=True)),
+            ('newsletter', self.gf('django.db.models.fields.related.ForeignKey')(related_name='language_set', to=orm['courriers.Newsletter'])),
+        ))
+        db.send_create_signal(u'courriers', ['NewsletterLanguage'])
+
+        # Adding unique constraint on 'NewsletterLanguage', fields ['lang', 'newsletter']
+        db.create_unique(u'courriers_newsletterlanguage', ['lang', 'newsletter_id'])
+
+        # Adding model 'NewsletterListLanguage'
+        db.create_table(u'courriers_newsletterlistlanguage', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('lang', self.gf('django.db.models.fields.CharField')(max_length=10, blank=True)),
+            ('newsletter_list', self.gf('django.db.models.fields.related.ForeignKey')(related_name='language_set', to=orm['courriers.NewsletterList'])),
+        ))
+        db.send_create_signal(u'courriers', ['NewsletterListLanguage'])
+
+        # Adding unique constraint on 'NewsletterListLanguage', fields ['lang', 'newsletter_list']
+        db.create_unique(u'courriers_newsletterlistlanguage', ['lang', 'newsletter_list_id'])
+
+        # Adding index on 'NewsletterSubscriber', fields ['newsletter_list', 'is_unsubscribed', 'lang']
+        db.create_index(u'courriers_newslettersubscriber', ['newsletter_list_id', 'is_unsubscribed', 'lang'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'NewsletterSubscriber', fields ['newsletter_list', 'is_unsubscribed', 'lang']
+        db.delete_index(u'courriers_newslettersubscriber', ['newsletter_list_id', 'is_unsubscribed', 'lang'])
+
+        # Removing unique constraint on 'NewsletterListLanguage', fields ['lang', 'newsletter_list']
+        db.delete_unique(u'courriers_newsletterlistlanguage', ['lang', 'newsletter_list_id'])
+
+        # Removing unique constraint on 'NewsletterLanguage', fields ['lang', 'newsletter']
+        db.delete_unique(u'courriers_newsletterlanguage', ['lang', 'newsletter_id'])
+
+        # Deleting model 'NewsletterLanguage'
+        db.delete_table(u'courriers_newsletterlanguage')
+
+        # Deleting model 'NewsletterListLanguage'
+        db.delete_table(u'courriers_newsletterlistlanguage')
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'courriers.newsletter': {
+            'Meta': {'object_name': 'Newsletter'},
+            'conclusion': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'cover': ('django.db.models.fields.files.ImageField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'headline': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'languages': ('separatedvaluesfield.models.SeparatedValuesField', [], {'max_length': '50', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'newsletter_list': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'newsletters'", 'to': u"orm['courriers.NewsletterList']"}),
+            'next_newsletter': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'on_delete': 'models.SET_NULL', 'to': u"orm['courriers.Newsletter']"}),
+            'previous_newsletter': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'on_delete': 'models.SET_NULL', 'to': u"orm['courriers.Newsletter']"}),
+            'published_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'sent': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'db_index': 'True'}),
+            'status': ('django.db.models.fields.PositiveIntegerField', [], {'default': '2', 'db_index': 'True'})
+        },
+        u'courriers.newsletteritem': {
+            'Meta': {'ordering': "['position']", 'object_name': 'NewsletterItem'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']", 'null': 'True', 'blank': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image': ('django.db.models.fields.files.ImageField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'newsletter': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'items'", 'to': u"orm['courriers.Newsletter']"}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'position': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'null': 'True', 'blank': 'True'})
+        },
+        u'courriers.newsletterlanguage': {
+            'Meta': {'unique_together': "(('lang', 'newsletter'),)", 'object_name': 'NewsletterLanguage'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'max_length': '10', 'blank': 'True'}),
+            'newsletter': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'language_set'", 'to': u"orm['courriers.Newsletter']"})
+        },
+        u'courriers.newsletterlist': {
+            'Meta': {'object_name': 'NewsletterList'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'languages': ('separatedvaluesfield.models.SeparatedValuesField', [], {'max_length': '50', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '255'})
+        },
+        u'courriers.newsletterlistlanguage': {
+            'Meta': {'unique_together': "(('lang', 'newsletter_list'),)", 'object_name': 'NewsletterListLanguage'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'max_length': '10', 'blank': 'True'}),
+            'newsletter_list': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'language_set'", 'to': u"orm['courriers.NewsletterList']"})
+        },
+        u'courriers.newslettersubscriber': {
+            'Meta': {'unique_together': "(('newsletter_list', 'email', 'lang'),)", 'object_name': 'NewsletterSubscriber', 'index_together': "[('newsletter_list', 'is_unsubscribed', 'lang')]"},
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '250'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_unsubscribed': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'db_index': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'max_length': '10', 'null': 'True', 'blank': 'True'}),
+            'newsletter_list': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'newsletter_subscribers'", 'to': u"orm['courriers.NewsletterList']"}),
+            'subscribed_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'unsubscribed_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        },
+        u'courriers.newslettersubscriptionrequest': {
+            'Meta': {'ordering': "['pk']", 'object_name': 'NewsletterSubscriptionRequest'},
+            'action': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '250'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'max_length': '10', 'null': 'True', 'blank': 'True'}),
+            'newsletter_list': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'subscription_requests'", 'null': 'True', 'to': u"orm['courriers.NewsletterList']"}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['courriers']
\ No newline at end of file
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+import errno
+import itertools
+import json
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+
+from six.moves import queue
+
+from django.conf import settings
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils.encoding import force_bytes, force_text
+
+from .settings import (SPOOL_BATCH_SIZE, SPOOL_CONNECTIONS, SPOOL_DIR, SPOOL_FSYNC, SPOOL_RELAY_BACKEND,
+                       SPOOL_STALE_TIMEOUT)
+from .signatures import mime_bytes
+
+logger = logging.getLogger('courriers')
+
+# The relay refused the message itself, delivering it again cannot succeed
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+def message_bytes(message):
+    return mime_bytes(message.message(), message.encoding or settings.DEFAULT_CHARSET)
+
+
+class SpooledMessage(object):
+    """
+    A finished message read from the spool, which the Django email
+    backends send as is.
+    """
+    encoding = None
+
+    def __init__(self, from_email, recipients, content):
+        self.from_email = from_email
+        self.to = recipients
+        self.content = content
+
+    def recipients(self):
+        return self.to
+
+    def message(self):
+        return self
+
+    def as_bytes(self, linesep='\r\n'):
+        return self.content
+
+    def as_string(self, *args, **kwargs):
+        return self.content
+
+
+class Spool(object):
+    """
+    A Maildir-like directory, messages are written to ``tmp`` then renamed
+    to ``new``, drainers claim them by renaming them to ``cur``. Permanently
+    refused messages are moved to ``failed``. A message can be taken over by
+    another drainer once stale, the moves of a message which is gone return
+    ``False``.
+    """
+    counter = itertools.count()
+
+    def __init__(self, path=None):
+        self.path = path or SPOOL_DIR
+
+        if not self.path:
+            raise ImproperlyConfigured('Please specify COURRIERS_SPOOL_DIR in Django settings')
+
+        for folder in ('tmp', 'new', 'cur', 'failed'):
+            try:
+                os.makedirs(os.path.join(self.path, folder))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def folder(self, name):
+        return os.path.join(self.path, name)
+
+    def unique_name(self):
+        return '%.6f.%d_%d.%s' % (time.time(), os.getpid(), next(self.counter),
+                                  socket.gethostname().replace('/', '_').replace(':', '_'))
+
+    def write(self, messages, fsync=None):
+        """
+        Spools ``messages``, the files and the ``new`` folder are synced
+        once for the whole batch. Returns the names of the new files.
+        """
+        fsync = SPOOL_FSYNC if fsync is None else fsync
+
+        names = []
+
+        for message in messages:
+            name = self.unique_name()
+
+            envelope = json.dumps({'from': message.from_email, 'to': list(message.recipients())})
+
+            with open(os.path.join(self.folder('tmp'), name), 'wb') as f:
+                f.write(force_bytes(envelope) + b'\n')
+                f.write(message_bytes(message))
+                f.flush()
+
+                if fsync:
+                    os.fsync(f.fileno())
+
+            names.append(name)
+
+        for name in names:
+            os.rename(os.path.join(self.folder('tmp'), name), os.path.join(self.folder('new'), name))
+
+        if fsync and names:
+            self.sync_folder('new')
+
+        return names
+
+    def sync_folder(self, name):
+        fd = os.open(self.folder(name), os.O_RDONLY)
+
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def listing(self):
+        """
+        Returns the names of the messages in ``new``, oldest first.
+        """
+        return sorted(os.listdir(self.folder('new')))
+
+    def claim(self, limit=None, listing=None):
+        """
+        Moves up to ``limit`` messages from ``new`` to ``cur`` and returns
+        their names, the rename fails for messages claimed by another drainer.
+        The names are taken from the ``listing`` iterator when given, so
+        that successive claims consume a single listing of ``new``.
+        """
+        listing = iter(self.listing()) if listing is None else listing
+
+        names = []
+
+        if limit is not None and limit <= 0:
+            return names
+
+        for name in listing:
+            path = os.path.join(self.folder('cur'), name)
+
+            try:
+                os.rename(os.path.join(self.folder('new'), name), path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+                continue
+
+            # Marks the claim time to recover the messages of dead drainers
+            os.utime(path, None)
+
+            names.append(name)
+
+            if limit is not None and len(names) >= limit:
+                break
+
+        return names
+
+    def recover(self, timeout=None):
+        """
+        Moves back to ``new`` the messages claimed more than ``timeout``
+        seconds ago.
+        """
+        timeout = SPOOL_STALE_TIMEOUT if timeout is None else timeout
+
+        limit = time.time() - timeout
+        count = 0
+
+        for name in os.listdir(self.folder('cur')):
+            try:
+                if os.path.getmtime(os.path.join(self.folder('cur'), name)) < limit and self.release(name):
+                    count += 1
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+        return count
+
+    def read(self, name):
+        """
+        Returns the claimed message ``name``, ``None`` when another drainer
+        took it.
+        """
+        path = os.path.join(self.folder('cur'), name)
+
+        try:
+            # Marks the send time, the message is not recovered while relayed
+            os.utime(path, None)
+
+            f = open(path, 'rb')
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            return None
+
+        with f:
+            envelope = json.loads(force_text(f.readline()))
+
+            return SpooledMessage(envelope['from'], envelope['to'], f.read())
+
+    def done(self, name):
+        try:
+            os.unlink(os.path.join(self.folder('cur'), name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            return False
+
+        return True
+
+    def move(self, name, folder):
+        try:
+            os.rename(os.path.join(self.folder('cur'), name), os.path.join(self.folder(folder), name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            return False
+
+        return True
+
+    def release(self, name):
+        return self.move(name, 'new')
+
+    def fail(self, name):
+        return self.move(name, 'failed')
+
+
+class SpoolEmailBackend(BaseEmailBackend):
+    """
+    Writes the messages to the spool instead of delivering them,
+    ``drain_spool`` relays them.
+    """
+    def __init__(self, path=None, fail_silently=False, **kwargs):
+        super(SpoolEmailBackend, self).__init__(fail_silently=fail_silently, **kwargs)
+
+        self.spool = Spool(path)
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+
+        messages = [message for message in email_messages if message.recipients()]
+
+        try:
+            return len(self.spool.write(messages))
+        except (IOError, OSError):
+            if not self.fail_silently:
+                raise
+
+            return 0
+
+
+def drain_worker(spool, names, backend, results):
+    """
+    Relays the messages of the ``names`` queue, appends its sent and failed
+    counts to ``results`` and whether the relay was available.
+    """
+    connection = mail.get_connection(backend)
+
+    sent = failed = 0
+    available = True
+
+    try:
+        # Kept open for all the messages of the worker
+        connection.open()
+    except Exception:
+        logger.exception('Unable to connect to the relay')
+
+        results.append((sent, failed, False))
+
+        return
+
+    try:
+        while True:
+            try:
+                name = names.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                message = spool.read(name)
+            except (IOError, ValueError, KeyError):
+                logger.exception('Invalid spooled message %s', name)
+
+                if spool.fail(name):
+                    failed += 1
+
+                continue
+
+            if message is None:
+                logger.warning('The spooled message %s was taken by another drainer', name)
+
+                continue
+
+            try:
+                connection.send_messages([message])
+            except PERMANENT_ERRORS:
+                logger.exception('The relay refused the spooled message %s', name)
+
+                spool.fail(name)
+
+                failed += 1
+            except Exception:
+                logger.exception('Unable to relay the spooled message %s', name)
+
+                # The relay is unavailable, the messages stay in the spool
+                spool.release(name)
+
+                available = False
+
+                break
+            else:
+                if not spool.done(name):
+                    logger.warning('The spooled message %s was relayed by another drainer too', name)
+
+                sent += 1
+    finally:
+        connection.close()
+
+        results.append((sent, failed, available))
+
+
+def drain(spool=None, connections=None, backend=None, limit=None, batch_size=None):
+    """
+    Relays up to ``limit`` spooled messages over ``connections`` parallel
+    connections of the ``backend`` email backend. The messages are claimed
+    by batches of ``batch_size``, so that the claimed ones are relayed
+    before they become stale. The batches are taken from a single listing of
+    the spool, which is listed again once exhausted. Returns the number of
+    sent and failed messages.
+    """
+    spool = spool or Spool()
+    batch_size = batch_size or SPOOL_BATCH_SIZE
+
+    spool.recover()
+
+    sent = failed = 0
+
+    listing = iter(spool.listing())
+
+    while limit is None or sent + failed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sent - failed)
+
+        names = spool.claim(size, listing)
+
+        if not names:
+            # Lists the messages spooled since the previous listing
+            listing = iter(spool.listing())
+
+            names = spool.claim(size, listing)
+
+        if not names:
+            break
+
+        batch_sent, batch_failed, available = drain_batch(spool, names, connections, backend)
+
+        sent += batch_sent
+        failed += batch_failed
+
+        if not available:
+            # The next batches wait for the relay in the spool
+            break
+
+    return sent, failed
+
+
+def drain_batch(spool, claimed, connections=None, backend=None):
+    """
+    Relays the ``claimed`` messages, returns the number of sent and failed
+    messages and whether the relay was available.
+    """
+    connections = connections or SPOOL_CONNECTIONS
+    backend = backend or SPOOL_RELAY_BACKEND
+
+    names = queue.Queue()
+
+    for name in claimed:
+        names.put(name)
+
+    results = []
+
+    threads = [threading.Thread(target=drain_worker, args=(spool, names, backend, results))
+               for i in range(min(connections, names.qsize()))]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # Left by workers which lost their connection
+    while not names.empty():
+        spool.release(names.get_nowait())
+
+    return (sum(sent for sent, failed, available in results),
+            sum(failed for sent, failed, available in results),
+            all(available for sent, failed, available in results))
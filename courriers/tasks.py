@@ -3,8 +3,9 @@ from celery.task import task
 
 
 @task(bind=True)
-def subscribe(self, email, newsletter_list_id, lang=None, user_id=None):
+def subscribe(self, email, newsletter_list_id, lang=None, user_id=None, idempotency_key=None):
     from courriers.backends import get_backend
+    from courriers.cache import release_task
     from courriers.models import NewsletterList
     from courriers.compat import get_user_model
 
@@ -30,10 +31,14 @@ def subscribe(self, email, newsletter_list_id, lang=None, user_id=None):
     except Exception as e:
         raise self.retry(exc=e, countdown=60)
 
+    if idempotency_key:
+        release_task(idempotency_key)
+
 
 @task(bind=True)
-def unsubscribe(self, email, newsletter_list_id=None, lang=None, user_id=None):
+def unsubscribe(self, email, newsletter_list_id=None, lang=None, user_id=None, idempotency_key=None):
     from courriers.backends import get_backend
+    from courriers.cache import release_task
     from courriers.models import NewsletterList
     from courriers.compat import get_user_model
 
@@ -58,3 +63,138 @@ def unsubscribe(self, email, newsletter_list_id=None, lang=None, user_id=None):
                            user=user)
     except Exception as e:
         raise self.retry(exc=e, countdown=60)
+
+    if idempotency_key:
+        release_task(idempotency_key)
+
+
+@task(bind=True)
+def flush_subscriptions(self, batch_size=None):
+    from courriers.backends import get_backend
+    from courriers.models import NewsletterSubscriptionRequest
+    from courriers.settings import COALESCE_BATCH_SIZE
+
+    batch_size = batch_size or COALESCE_BATCH_SIZE
+
+    # Overlapping flushes apply distinct requests
+    requests = list(NewsletterSubscriptionRequest.objects.claim(batch_size).select_related('newsletter_list'))
+
+    if not requests:
+        return 0
+
+    backend = get_backend()()
+
+    try:
+        for action, newsletter_list, lang, emails in NewsletterSubscriptionRequest.objects.coalesce(requests):
+            if action == NewsletterSubscriptionRequest.ACTION_SUBSCRIBE:
+                backend.bulk_register(list(emails), newsletter_list, lang=lang, user_ids=emails)
+            else:
+                backend.bulk_unregister(list(emails), newsletter_list, lang=lang)
+    except Exception as e:
+        NewsletterSubscriptionRequest.objects.release(requests)
+
+        raise self.retry(exc=e, countdown=60)
+
+    NewsletterSubscriptionRequest.objects.filter(pk__in=[request.pk for request in requests]).delete()
+
+    if len(requests) == batch_size:
+        flush_subscriptions.delay(batch_size=batch_size)
+
+    return len(requests)
+
+
+@task(bind=True)
+def generate_renditions(self, name):
+    from courriers.models import Newsletter, NewsletterSnapshot
+    from courriers.renditions import generate_renditions
+    from django.db.models import Q
+    from django.utils import timezone as datetime
+
+    try:
+        urls = generate_renditions(name)
+    except IOError as e:
+        raise self.retry(exc=e, countdown=60)
+
+    # Newsletters rendered before the renditions existed
+    newsletter_ids = list(Newsletter.objects
+                          .filter(Q(cover=name) | Q(items__image=name))
+                          .values_list('pk', flat=True)
+                          .distinct())
+
+    NewsletterSnapshot.objects.filter(newsletter__in=newsletter_ids).delete()
+    Newsletter.objects.filter(pk__in=newsletter_ids).update(updated_at=datetime.now())
+
+    return urls
+
+
+@task(bind=True)
+def send_newsletter(self, newsletter_id, pk_range=None, using=None):
+    from courriers.backends import get_backend
+    from courriers.exceptions import DuplicateSendError
+    from courriers.models import Newsletter
+    from courriers.scheduler import send_batch
+
+    newsletter = Newsletter.objects.get(pk=newsletter_id)
+
+    backend = get_backend()()
+
+    try:
+        if pk_range:
+            send_batch(backend, newsletter, pk_range, using=using)
+        else:
+            backend.send_mails(newsletter, using=using)
+    except DuplicateSendError:
+        raise
+    except Exception as e:
+        if pk_range and self.max_retries is not None and self.request.retries >= self.max_retries:
+            # The batch is given up, the send cannot complete
+            newsletter.finish_send(failed=True)
+
+        raise self.retry(exc=e, countdown=60)
+
+
+@task(bind=True)
+def send_scheduled_newsletters(self):
+    from courriers.scheduler import dispatch_due_newsletters
+
+    return len(dispatch_due_newsletters())
+
+
+@task(bind=True)
+def send_newsletter_shards(self, newsletter_id, using=None):
+    from courriers.backends import get_backend
+    from courriers.models import Newsletter
+    from courriers.scheduler import send_shards
+
+    newsletter = Newsletter.objects.get(pk=newsletter_id)
+
+    return send_shards(get_backend()(), newsletter, using=using)
+
+
+@task(bind=True)
+def process_events(self, batch_size=None):
+    from courriers.models import NewsletterEvent
+    from courriers.settings import EVENTS_BATCH_SIZE
+    from courriers import webhooks
+
+    batch_size = batch_size or EVENTS_BATCH_SIZE
+
+    # Overlapping runs process distinct events
+    events = list(NewsletterEvent.objects.claim(batch_size))
+
+    if not events:
+        return 0
+
+    try:
+        webhooks.process_events(events)
+    except Exception as e:
+        NewsletterEvent.objects.release(events)
+
+        raise self.retry(exc=e, countdown=60)
+
+    NewsletterEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+
+    if len(events) == batch_size:
+        process_events.delay(batch_size=batch_size)
+
+    return len(events)
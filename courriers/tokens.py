@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from django.core import signing
+
+UNSUBSCRIBE_SALT = 'courriers.unsubscribe'
+
+
+def make_unsubscribe_token(subscriber):
+    return signing.dumps([subscriber.pk, subscriber.newsletter_list_id, subscriber.lang],
+                         salt=UNSUBSCRIBE_SALT)
+
+
+def parse_unsubscribe_token(token):
+    """
+    Returns the ``(subscriber_id, newsletter_list_id, lang)`` signed in
+    ``token``, or ``None`` when the signature is invalid.
+    """
+    try:
+        subscriber_id, newsletter_list_id, lang = signing.loads(token, salt=UNSUBSCRIBE_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+    return subscriber_id, newsletter_list_id, lang
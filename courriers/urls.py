@@ -6,7 +6,10 @@ from .views import (NewsletterListView,
                     NewsletterRawDetailView,
                     NewsletterListUnsubscribeView,
                     NewsletterListSubscribeDoneView,
-                    NewsletterListUnsubscribeDoneView)
+                    NewsletterListUnsubscribeDoneView,
+                    NewsletterOneClickUnsubscribeView,
+                    NewsletterWebhookView,
+                    NewsletterMetricsView)
 
 
 urlpatterns = patterns(
@@ -35,6 +38,18 @@ urlpatterns = patterns(
         NewsletterListUnsubscribeDoneView.as_view(),
         name="newsletter_list_unsubscribe_done"),
 
+    url(r'^unsubscribe/(?P<token>([\w\-\.]+:[\w\-:]+))/$',
+        NewsletterOneClickUnsubscribeView.as_view(),
+        name="newsletter_one_click_unsubscribe"),
+
+    url(r'^webhooks/(?P<source>(mailjet|mailchimp|generic))/$',
+        NewsletterWebhookView.as_view(),
+        name="newsletter_webhook"),
+
+    url(r'^metrics/$',
+        NewsletterMetricsView.as_view(),
+        name="newsletter_metrics"),
+
     url(r'^(?P<slug>(\w+))/(?:(?P<lang>(\w+))/)?(?:(?P<page>(\d+))/)?$',
         NewsletterListView.as_view(),
         name="newsletter_list"),
@@ -1,7 +1,13 @@
 #-*- coding: utf-8 -*-
+import base64
+import binascii
+
 import six
 
 from django.core import exceptions
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import SimpleLazyObject
 
 try:
     from importlib import import_module
@@ -9,6 +15,14 @@ except ImportError:
     from django.utils.importlib import import_module
 
 
+def lazy_import(path):
+    """
+    Returns a proxy to the object at ``path``, its module is imported
+    the first time the proxy is used.
+    """
+    return SimpleLazyObject(lambda: load_class(path))
+
+
 CLASS_PATH_ERROR = 'django-courriers is unable to interpret settings value for %s. '\
                    '%s should be in the form of a tupple: '\
                    '(\'path.to.models.Class\', \'app_label\').'
@@ -82,3 +96,28 @@ def ajaxify_template_name(name):
     else:
         name += "-ajax"
     return name
+
+
+def encode_cursor(published_at, pk):
+    value = '%s|%s' % (published_at.isoformat(), pk)
+
+    return force_text(base64.urlsafe_b64encode(force_bytes(value))).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(published_at, pk)`` tuple encoded in ``cursor``,
+    or ``None`` when the cursor is invalid.
+    """
+    try:
+        value = force_text(base64.urlsafe_b64decode(force_bytes(cursor + '=' * (-len(cursor) % 4))))
+        published_at, pk = value.split('|')
+
+        published_at, pk = parse_datetime(published_at), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+
+    if published_at is None:
+        return None
+
+    return published_at, pk
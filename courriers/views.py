@@ -1,16 +1,34 @@
 # -*- coding: utf-8 -*-
-from django.views.generic import ListView, DetailView, FormView, TemplateView
+import hashlib
+
+from calendar import timegm
+
+from django.views.generic import ListView, DetailView, FormView, TemplateView, View
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.db.models import Q
+from django.http import (Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified,
+                         HttpResponseRedirect)
 from django.shortcuts import get_object_or_404
 from django.utils.functional import cached_property
 from django.views.generic.base import TemplateResponseMixin
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.encoding import force_text
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 from django.utils.translation import get_language
-
-from .settings import PAGINATE_BY
-from .models import Newsletter, NewsletterList
+from django.utils import timezone as datetime
+
+from .backends import get_backend
+from .cache import archive_page_key, cache
+from . import metrics
+from .settings import (ARCHIVE_CACHE_TIMEOUT, CURSOR_PAGINATION, HTTP_CACHE_MAX_AGE, METRICS_TOKEN,
+                       PAGINATE_BY, WEBHOOK_TOKEN)
+from .models import Newsletter, NewsletterEvent, NewsletterList, NewsletterSnapshot
 from .forms import SubscriptionForm, UnsubscribeForm
-from .utils import ajaxify_template_var
+from .tokens import parse_unsubscribe_token
+from .utils import ajaxify_template_var, decode_cursor, encode_cursor
 
 
 class AJAXResponseMixin(TemplateResponseMixin):
@@ -27,46 +45,233 @@ class AJAXResponseMixin(TemplateResponseMixin):
         return names
 
 
-class NewsletterListView(AJAXResponseMixin, ListView):
+class DatabaseMixin(object):
+    # Database alias to read from, the routers decide when None
+    using = None
+
+
+class ConditionalResponseMixin(object):
+    """
+    Answers conditional GET requests on a newsletter with a 304 response,
+    looking only at its content version.
+    """
+    cache_control = {'public': True}
+    # The pages differ for AJAX requests and by language
+    vary_headers = ('X-Requested-With', 'Accept-Language')
+    etag_fields = ('updated_at', )
+
+    def get_version(self, values):
+        """
+        Returns the version of the page built from the ``etag_fields``
+        ``values``, its last modification date and the date when the
+        page changes by itself, if any.
+        """
+        return values, values[0], None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super(ConditionalResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        self.request, self.args, self.kwargs = request, args, kwargs
+
+        versions = list(self.get_queryset()
+                        .filter(pk=self.kwargs.get(self.pk_url_kwarg))
+                        .values_list(*self.etag_fields)[:1])
+
+        if not versions:
+            return super(ConditionalResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        version, modified_at, expires_at = self.get_version(versions[0])
+
+        last_modified = timegm(modified_at.utctimetuple())
+
+        etag = quote_etag(hashlib.md5(('%s:%s:%s:%s' % (self.__class__.__name__,
+                                                        version,
+                                                        get_language(),
+                                                        request.is_ajax())).encode('utf-8')).hexdigest())
+
+        if self.is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = super(ConditionalResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+
+        max_age = HTTP_CACHE_MAX_AGE
+
+        if expires_at is not None:
+            delta = expires_at - datetime.now()
+
+            max_age = max(0, min(max_age, delta.days * 86400 + delta.seconds + 1))
+
+        patch_cache_control(response, max_age=max_age, **self.cache_control)
+        patch_vary_headers(response, self.vary_headers)
+
+        return response
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+
+            return etag in etags or etag.strip('"') in etags or '*' in etags
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+
+class NewsletterListView(DatabaseMixin, AJAXResponseMixin, ListView):
     model = Newsletter
     context_object_name = 'newsletters'
     template_name = 'courriers/newsletter_list.html'
     paginate_by = PAGINATE_BY
+    cursor_pagination = CURSOR_PAGINATION
+    cursor_kwarg = 'cursor'
 
     def dispatch(self, *args, **kwargs):
         self.lang = kwargs.get('lang', None) or get_language()
 
         return super(NewsletterListView, self).dispatch(*args, **kwargs)
 
+    def get(self, request, *args, **kwargs):
+        if not ARCHIVE_CACHE_TIMEOUT:
+            return super(NewsletterListView, self).get(request, *args, **kwargs)
+
+        if self.cursor_pagination:
+            page = 'cursor-%s' % request.GET.get(self.cursor_kwarg, '')
+        else:
+            page = self.kwargs.get(self.page_kwarg) or request.GET.get(self.page_kwarg) or 1
+
+        key = archive_page_key(self.kwargs.get('slug'), self.lang, page, request.is_ajax())
+
+        cached = cache().get(key)
+
+        if cached is not None:
+            content, content_type = cached
+
+            return HttpResponse(content, content_type=content_type)
+
+        response = super(NewsletterListView, self).get(request, *args, **kwargs)
+        response.render()
+
+        if response.status_code == 200:
+            cache().set(key, (response.content, response['Content-Type']), self.get_cache_timeout())
+
+        return response
+
+    def get_cache_timeout(self):
+        # Scheduled newsletters show up without being saved again,
+        # the page must expire when the next one is published.
+        published_at = (self.newsletter_list.newsletters
+                        .using(self.using)
+                        .filter(status=Newsletter.STATUS_ONLINE, published_at__gte=datetime.now())
+                        .order_by('published_at')
+                        .values_list('published_at', flat=True)[:1])
+
+        if published_at:
+            delta = published_at[0] - datetime.now()
+
+            return max(1, min(ARCHIVE_CACHE_TIMEOUT, delta.days * 86400 + delta.seconds + 1))
+
+        return ARCHIVE_CACHE_TIMEOUT
+
     @cached_property
     def newsletter_list(self):
-        return get_object_or_404(NewsletterList.objects.has_lang(self.lang),
+        return get_object_or_404(NewsletterList.objects.db_manager(self.using).has_lang(self.lang),
                                  slug=self.kwargs.get('slug'))
 
     def get_queryset(self):
         return (self.newsletter_list.newsletters
+                .using(self.using)
                 .status_online()
                 .has_lang(self.lang)
                 .order_by('-published_at'))
 
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination:
+            return super(NewsletterListView, self).paginate_queryset(queryset, page_size)
+
+        # Reads a range of the (published_at, pk) ordering, one extra row
+        # tells whether there is a next page without counting.
+        queryset = queryset.filter(published_at__isnull=False).order_by('-published_at', '-pk')
+
+        cursor = self.request.GET.get(self.cursor_kwarg)
+
+        if cursor:
+            position = decode_cursor(cursor)
+
+            if position is None:
+                raise Http404
+
+            published_at, pk = position
+
+            queryset = queryset.filter(Q(published_at__lt=published_at) |
+                                       Q(published_at=published_at, pk__lt=pk))
+
+        object_list = list(queryset[:page_size + 1])
+
+        has_next = len(object_list) > page_size
+        object_list = object_list[:page_size]
+
+        if has_next:
+            self.next_cursor = encode_cursor(object_list[-1].published_at, object_list[-1].pk)
+
+        return (None, None, object_list, has_next or bool(cursor))
+
     def get_context_data(self, **kwargs):
         context = super(NewsletterListView, self).get_context_data(**kwargs)
         context['newsletter_list'] = self.newsletter_list
+
+        if self.cursor_pagination:
+            context['next_cursor'] = getattr(self, 'next_cursor', None)
+
         return context
 
 
-class NewsletterDetailView(AJAXResponseMixin, DetailView):
+class NewsletterDetailView(DatabaseMixin, ConditionalResponseMixin, AJAXResponseMixin, DetailView):
     model = Newsletter
     context_object_name = 'newsletter'
     template_name = 'courriers/newsletter_detail.html'
+    # The page embeds a CSRF token and links to its siblings
+    cache_control = {'private': True}
+    etag_fields = ('updated_at', 'previous_newsletter', 'previous_newsletter__updated_at',
+                   'next_newsletter', 'next_newsletter__updated_at', 'next_newsletter__published_at')
+
+    def get_version(self, values):
+        updated_at, previous_id, previous_updated_at, next_id, next_updated_at, next_published_at = values
+
+        dates = [updated_at, previous_updated_at]
+
+        # The next newsletter is only linked once published
+        if next_id and next_published_at is not None and next_published_at < datetime.now():
+            dates += [next_updated_at, next_published_at]
+            expires_at = None
+        else:
+            next_id = next_updated_at = None
+            expires_at = next_published_at
+
+        version = (updated_at, previous_id, previous_updated_at, next_id, next_updated_at)
+
+        return version, max(date for date in dates if date is not None), expires_at
 
     def get_queryset(self):
-        return self.model.objects.status_online().has_lang(get_language())
+        return (self.model.objects.db_manager(self.using).status_online()
+                .has_lang(get_language())
+                .select_related('newsletter_list', 'previous_newsletter', 'next_newsletter'))
 
     def get_context_data(self, **kwargs):
         context = super(NewsletterDetailView, self).get_context_data(**kwargs)
 
         context['newsletter_list'] = self.object.newsletter_list
+        context['previous_object'] = self.object.previous_newsletter
+
+        next_object = self.object.next_newsletter
+
+        if next_object and next_object.published_at < datetime.now():
+            context['next_object'] = next_object
 
         return context
 
@@ -128,17 +333,25 @@ class NewsletterListSubscribeView(BaseNewsletterListFormView):
         return reverse('newsletter_list_subscribe_done')
 
 
-class NewsletterRawDetailView(AJAXResponseMixin, DetailView):
+class NewsletterRawDetailView(DatabaseMixin, ConditionalResponseMixin, AJAXResponseMixin, DetailView):
     model = Newsletter
     template_name = 'courriers/newsletter_raw_detail.html'
 
+    def get_queryset(self):
+        return self.model.objects.db_manager(self.using).all()
+
+    def get(self, request, *args, **kwargs):
+        if request.is_ajax():
+            return super(NewsletterRawDetailView, self).get(request, *args, **kwargs)
+
+        self.object = self.get_object()
+
+        return HttpResponse(NewsletterSnapshot.objects.get_for(self.object, get_language()).html)
+
     def get_context_data(self, **kwargs):
         context = super(NewsletterRawDetailView, self).get_context_data(**kwargs)
 
-        context['items'] = self.object.items.all()
-
-        for item in context['items']:
-            item.newsletter = self.object
+        context['items'] = self.object.get_items()
 
         return context
 
@@ -186,3 +399,82 @@ class NewsletterListSubscribeDoneView(AJAXResponseMixin, TemplateView):
     template_name = "courriers/newsletter_list_subscribe_done.html"
     model = NewsletterList
     context_object_name = 'newsletter_list'
+
+
+class NewsletterOneClickUnsubscribeView(DatabaseMixin, AJAXResponseMixin, TemplateView):
+    """
+    Cancels the subscription signed in the token of the ``List-Unsubscribe``
+    header (RFC 8058), nothing is read before the update.
+    """
+    template_name = 'courriers/newsletter_one_click_unsubscribe.html'
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        self.subscription = parse_unsubscribe_token(self.kwargs['token'])
+
+        if self.subscription is None:
+            raise Http404
+
+        return super(NewsletterOneClickUnsubscribeView, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        subscriber_id, newsletter_list_id, lang = self.subscription
+
+        get_backend()().unregister_subscriber(subscriber_id, newsletter_list_id, lang=lang, using=self.using)
+
+        # Mail clients posting List-Unsubscribe=One-Click only need a 200
+        return self.render_to_response(self.get_context_data(done=True))
+
+
+class NewsletterWebhookView(View):
+    """
+    Stores the events posted by a provider, they are applied
+    later by the ``process_events`` task. The endpoint is disabled
+    until ``COURRIERS_WEBHOOK_TOKEN`` is set.
+    """
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        if not WEBHOOK_TOKEN:
+            raise Http404
+
+        if not constant_time_compare(request.GET.get('token', ''), WEBHOOK_TOKEN):
+            return HttpResponseForbidden()
+
+        return super(NewsletterWebhookView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        # Mailchimp checks that the URL exists before using it
+        return HttpResponse()
+
+    def post(self, request, *args, **kwargs):
+        source = self.kwargs['source']
+
+        if source == NewsletterEvent.SOURCE_MAILCHIMP:
+            payload = request.POST.urlencode()
+        else:
+            payload = force_text(request.body)
+
+        NewsletterEvent.objects.create(source=source, payload=payload)
+
+        return HttpResponse()
+
+
+class NewsletterMetricsView(View):
+    """
+    Exposes the metrics of the current process to Prometheus, to the staff
+    or with the ``METRICS_TOKEN``. The metrics recorded by the workers are
+    only aggregated by the StatsD sink.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if METRICS_TOKEN:
+            if not constant_time_compare(request.GET.get('token', ''), METRICS_TOKEN):
+                return HttpResponseForbidden()
+        elif not request.user.is_staff:
+            return HttpResponseForbidden()
+
+        return super(NewsletterMetricsView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        metrics.update_queue_depths()
+
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
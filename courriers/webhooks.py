@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+from django.http import QueryDict
+
+from .models import NewsletterEvent, NewsletterList
+
+logger = logging.getLogger('courriers')
+
+EVENT_UNSUBSCRIBE = 'unsubscribe'
+EVENT_COMPLAINT = 'complaint'
+EVENT_BOUNCE = 'bounce'
+
+
+def _load_json(payload):
+    data = json.loads(payload)
+
+    return data if isinstance(data, list) else [data]
+
+
+def parse_mailjet(payload):
+    for event in _load_json(payload):
+        if event.get('event') == 'unsub':
+            yield EVENT_UNSUBSCRIBE, event.get('email'), event.get('mj_list_id') or event.get('listid')
+        elif event.get('event') == 'spam':
+            yield EVENT_COMPLAINT, event.get('email'), None
+        elif event.get('event') == 'bounce' and event.get('hard_bounce'):
+            yield EVENT_BOUNCE, event.get('email'), None
+
+
+def parse_mailchimp(payload):
+    data = QueryDict(payload)
+
+    if data.get('type') == 'unsubscribe':
+        yield EVENT_UNSUBSCRIBE, data.get('data[email]'), data.get('data[list_id]')
+    elif data.get('type') == 'cleaned':
+        yield EVENT_BOUNCE, data.get('data[email]'), None
+
+
+def parse_generic(payload):
+    """
+    Parses ``{"event": "bounce|complaint|unsubscribe", "email": "..."}``
+    objects, alone or in a list. Unsubscribes apply to the list of the
+    ``list`` slug when given, to every list otherwise.
+    """
+    for event in _load_json(payload):
+        if event.get('event') == 'unsubscribe':
+            yield EVENT_UNSUBSCRIBE, event.get('email'), event.get('list')
+        elif event.get('event') == 'complaint':
+            yield EVENT_COMPLAINT, event.get('email'), None
+        elif event.get('event') == 'bounce':
+            yield EVENT_BOUNCE, event.get('email'), None
+
+
+PARSERS = {
+    NewsletterEvent.SOURCE_MAILJET: parse_mailjet,
+    NewsletterEvent.SOURCE_MAILCHIMP: parse_mailchimp,
+    NewsletterEvent.SOURCE_GENERIC: parse_generic,
+}
+
+
+def get_newsletter_lists(source):
+    """
+    Returns the ``(newsletter_list, lang)`` targeted by each list id of the
+    unsubscribe events of ``source``. The provider lists are only known
+    when the provider is the configured backend.
+    """
+    from .backends import get_backend
+
+    if source == NewsletterEvent.SOURCE_GENERIC:
+        lists = dict((newsletter_list.slug, (newsletter_list, None)) for newsletter_list in NewsletterList.objects.all())
+        # Without list, the email is unsubscribed from every list
+        lists[None] = (None, None)
+
+        return lists
+
+    backend_klass = get_backend()
+
+    if getattr(backend_klass, 'event_source', None) != source:
+        return {}
+
+    return backend_klass().get_newsletter_lists()
+
+
+def process_events(events):
+    """
+    Unsubscribes and flags as bounced the emails found in ``events``
+    with a few set based updates, returns both sets of emails.
+    Complaints cancel every subscription of the email, unsubscribes
+    only the one of their list.
+    """
+    from .backends.simple import SimpleBackend
+
+    complaints = set()
+    bounces = set()
+    unsubscribes = {}
+
+    for event in events:
+        try:
+            for action, email, list_id in PARSERS[event.source](event.payload):
+                if not email:
+                    continue
+
+                if action == EVENT_UNSUBSCRIBE:
+                    unsubscribes.setdefault((event.source, list_id), set()).add(email.lower())
+                elif action == EVENT_COMPLAINT:
+                    complaints.add(email.lower())
+                else:
+                    bounces.add(email.lower())
+        except (KeyError, ValueError, AttributeError, TypeError):
+            logger.warning('Invalid %s event %s', event.source, event.pk, exc_info=True)
+
+    # The providers already know about these events, only the
+    # subscriptions stored in the database are updated.
+    backend = SimpleBackend()
+
+    unsubscribed = set(complaints)
+
+    if complaints:
+        backend.bulk_unregister(complaints)
+
+    newsletter_lists = {}
+
+    for (source, list_id), emails in unsubscribes.items():
+        if source not in newsletter_lists:
+            newsletter_lists[source] = get_newsletter_lists(source)
+
+        if list_id not in newsletter_lists[source]:
+            logger.warning('Unknown %s list %s, %d unsubscribes ignored', source, list_id, len(emails))
+
+            continue
+
+        newsletter_list, lang = newsletter_lists[source][list_id]
+
+        backend.bulk_unregister(emails, newsletter_list, lang=lang)
+
+        unsubscribed |= emails
+
+    if bounces:
+        backend.bulk_bounce(bounces)
+
+    return unsubscribed, bounces
@@ -23,6 +23,10 @@ setup(
     install_requires=[
         "django-separatedvaluesfield",
     ],
+    extras_require={
+        # The signatures use the internals of dkimpy 1.0
+        'dkim': ['dkimpy>=1.0,<1.1'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Intended Audience :: Developers',